@@ -14,8 +14,9 @@ import pandas as pd
 from datetime import datetime, timedelta, timezone
 import time
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import io
+import threading
 
 # ============================================================
 # CONFIG
@@ -290,18 +291,66 @@ class SimpleSentimentAnalyzer:
             "violations": keyword_analysis["violations"]
         }
 
+# ============================================================
+# RATE LIMITER
+# ============================================================
+
+class DomainRateLimiter:
+    """Giới hạn tốc độ request theo từng domain (token bucket)
+
+    Mỗi domain có 1 "xô" chứa tối đa `burst` token, được nạp lại với tốc độ
+    `requests_per_second`. Mỗi request lấy 1 token, hết token thì chờ.
+    Dùng chung 1 instance cho mọi thread để vẫn lịch sự khi cào song song.
+    """
+    def __init__(self, requests_per_second=2.0, burst=4, per_domain=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        # Cấu hình riêng cho từng site: {'cafef.vn': (requests_per_second, burst)}
+        self.per_domain = per_domain or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        return domain[4:] if domain.startswith('www.') else domain
+    
+    def acquire(self, url):
+        """Chờ tới khi domain của url còn token rồi lấy 1 token"""
+        domain = self._domain(url)
+        rate, burst = self.per_domain.get(domain, (self.requests_per_second, self.burst))
+        if rate <= 0:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(domain, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[domain] = (tokens - 1, now)
+                    return
+                self._buckets[domain] = (tokens, now)
+                wait_time = (1 - tokens) / rate
+            time.sleep(wait_time)
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    """Rate limiter dùng chung cho cả process - mọi lần chạy / người dùng chung xô token mỗi site"""
+    return DomainRateLimiter()
+
 # ============================================================
 # STOCK SCRAPER
 # ============================================================
 
 class StockScraperWeb:
-    def __init__(self, stock_df, time_filter_hours=24):
+    def __init__(self, stock_df, time_filter_hours=24, rate_limiter=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept-Language': 'vi-VN,vi;q=0.9,en;q=0.8',
         }
         self.all_articles = []
         self.session = requests.Session()
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
         self.time_filter_hours = time_filter_hours
         
         self.vietnam_tz = timezone(timedelta(hours=7))
@@ -519,6 +568,7 @@ class StockScraperWeb:
     def fetch_url(self, url, max_retries=2):
         for attempt in range(max_retries):
             try:
+                self.rate_limiter.acquire(url)
                 response = self.session.get(url, headers=self.headers, timeout=15)
                 response.raise_for_status()
                 return response
@@ -656,8 +706,6 @@ class StockScraperWeb:
                             })
                             
                             count += 1
-                            time.sleep(0.5)
-                            
                             if count >= max_articles:
                                 break
             
@@ -675,7 +723,6 @@ class StockScraperWeb:
         
         for url, name, pattern in sources:
             self.scrape_source(url, name, pattern, max_articles_per_source, progress_callback)
-            time.sleep(1)
         
         if len(self.all_articles) == 0:
             return None
@@ -773,7 +820,7 @@ def main():
                 status_text.text(message)
                 progress_bar.progress(progress)
             
-            scraper = StockScraperWeb(stock_df, time_filter_hours=time_filter)
+            scraper = StockScraperWeb(stock_df, time_filter_hours=time_filter, rate_limiter=get_rate_limiter())
             df = scraper.run(max_articles_per_source=max_articles, progress_callback=update_progress)
             
             progress_bar.empty()
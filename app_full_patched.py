@@ -9,13 +9,38 @@
 
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from dateutil.parser import isoparse
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import time
 import re
-from urllib.parse import urljoin
+import math
+import codecs
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
 import io
+import threading
+import os
+import json
+import hashlib
+import tempfile
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import cached_property
+from collections import Counter
+from contextlib import contextmanager
+import queue
+import uuid
 
 # ============================================================
 # CONFIG
@@ -89,23 +114,34 @@ def load_default_stock_list():
     }
     return pd.DataFrame(default_data)
 
+# Tên cột được chấp nhận trong file danh sách mã (đã strip + lower) -> tên cột chuẩn
+STOCK_FILE_COLUMNS = {
+    'mã ck': 'Mã CK', 'ma ck': 'Mã CK', 'mã': 'Mã CK', 'code': 'Mã CK',
+    'sàn': 'Sàn', 'san': 'Sàn', 'exchange': 'Sàn',
+    'tên công ty': 'Tên công ty', 'ten cong ty': 'Tên công ty', 'name': 'Tên công ty',
+}
+
+def stock_file_key(uploaded_file):
+    """Hash nội dung file upload - khoá cache danh sách mã và chỉ mục tra cứu"""
+    return hashlib.sha1(uploaded_file.getvalue()).hexdigest()
+
 def parse_stock_file(uploaded_file):
-    """Parse Excel/CSV file"""
+    """Parse Excel/CSV file - cache theo nội dung file, rerun không đọc lại"""
+    return _parse_stock_bytes(stock_file_key(uploaded_file), uploaded_file.name, uploaded_file.getvalue())
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _parse_stock_bytes(file_key, file_name, _data):
     try:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
+        # Chỉ đọc các cột cần dùng
+        usecols = lambda col: str(col).strip().lower() in STOCK_FILE_COLUMNS
+        if file_name.endswith('.csv'):
+            df = pd.read_csv(io.BytesIO(_data), usecols=usecols)
         else:
-            df = pd.read_excel(uploaded_file)
+            df = pd.read_excel(io.BytesIO(_data), usecols=usecols)
         
         df.columns = df.columns.str.strip().str.lower()
         
-        column_mapping = {
-            'mã ck': 'Mã CK', 'ma ck': 'Mã CK', 'mã': 'Mã CK', 'code': 'Mã CK',
-            'sàn': 'Sàn', 'san': 'Sàn', 'exchange': 'Sàn',
-            'tên công ty': 'Tên công ty', 'ten cong ty': 'Tên công ty', 'name': 'Tên công ty',
-        }
-        
-        for old_col, new_col in column_mapping.items():
+        for old_col, new_col in STOCK_FILE_COLUMNS.items():
             if old_col in df.columns:
                 df.rename(columns={old_col: new_col}, inplace=True)
         
@@ -148,10 +184,408 @@ def create_sample_excel():
     
     return buffer.getvalue()
 
+# ============================================================
+# EXPORT (EXCEL / CSV / PARQUET)
+# ============================================================
+
+# Sheet Excel: (tên sheet, mức Risk - None là tất cả)
+EXCEL_SHEETS = [('Tất cả', None), ('Nghiêm trọng', 'Nghiêm trọng'), ('Cảnh báo', 'Cảnh báo')]
+
+EXPORT_FORMATS = {
+    'xlsx': ("Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'csv': ("CSV (.csv) - nhanh", "text/csv"),
+    'parquet': ("Parquet (.parquet) - nhanh, gọn", "application/vnd.apache.parquet"),
+}
+
+def result_key(df):
+    """Khoá của 1 bộ kết quả - file xuất được cache theo khoá này"""
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+def _excel_value(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+def write_excel_streaming(df, output):
+    """Ghi Excel bằng openpyxl write-only: từng dòng ghi thẳng ra file, không tạo bản sao DataFrame / ô
+
+    Mỗi sheet lọc theo Risk được ghi bằng 1 lượt duyệt df, sheet rỗng thì bỏ (giống bản cũ).
+    """
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    risks = df['Risk']
+    for sheet_name, risk in EXCEL_SHEETS:
+        if risk is not None and not (risks == risk).any():
+            continue
+        sheet = workbook.create_sheet(sheet_name)
+        header = []
+        for column in df.columns:
+            cell = WriteOnlyCell(sheet, value=column)
+            cell.font = header_font
+            header.append(cell)
+        sheet.append(header)
+        for row_risk, row in zip(risks, df.itertuples(index=False, name=None)):
+            if risk is None or row_risk == risk:
+                sheet.append([_excel_value(value) for value in row])
+    workbook.save(output)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_export(key, fmt, _df):
+    """Bytes của file xuất - chỉ tạo khi người dùng yêu cầu, cache theo (key, định dạng)"""
+    buffer = io.BytesIO()
+    if fmt == 'xlsx':
+        write_excel_streaming(_df, buffer)
+    elif fmt == 'csv':
+        # BOM để Excel mở đúng tiếng Việt
+        _df.to_csv(buffer, index=False, encoding='utf-8-sig')
+    elif fmt == 'parquet':
+        _df.to_parquet(buffer, index=False)
+    else:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    return buffer.getvalue()
+
+# ============================================================
+# HTML PARSER
+# ============================================================
+
+def _pick_html_parser():
+    """Parser cho BeautifulSoup: lxml (viết bằng C) nếu đã cài, không thì html.parser
+
+    Có thể ép parser bằng biến môi trường SCRAPER_HTML_PARSER (vd. 'html.parser').
+    """
+    forced = os.environ.get('SCRAPER_HTML_PARSER')
+    if forced:
+        return forced
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+HTML_PARSER = _pick_html_parser()
+
+# Thẻ <p> / <div> mở và đóng trong markup - đếm để nhận ra trang có thẻ không đóng
+BLOCK_TAG_RE = re.compile(r'<(/?)(p|div)\b', re.I)
+
+def has_unclosed_blocks(markup):
+    """True nếu markup có <p> hoặc <div> mở nhiều hơn đóng"""
+    counts = Counter()
+    for (slash, name), n in Counter(BLOCK_TAG_RE.findall(markup)).items():
+        counts[slash, name.lower()] += n
+    return any(counts['', name] > counts['/', name] for name in ('p', 'div'))
+
+class TagStrainer(SoupStrainer):
+    """SoupStrainer chỉ tạo các thẻ thoả match(name, attrs) - cùng toàn bộ thẻ con của chúng
+
+    Phần còn lại của trang (menu, script, tin liên quan...) không được dựng thành cây.
+    """
+    def __init__(self, match):
+        super().__init__()
+        self.match = match
+    
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # bs4 >= 4.13
+        return bool(self.match(name, attrs or {}))
+    
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # bs4 4.12 gọi search_tag(name, attrs) khi dựng cây
+        if isinstance(markup_name, str):
+            return self.match(markup_name, markup_attrs or {})
+        return super().search_tag(markup_name, markup_attrs)
+
+# Thẻ mà fetch_article_content đọc: ứng viên ngày đăng, khối nội dung và đoạn văn
+ARTICLE_DATE_CLASS_RE = re.compile(r'date|time|publish|post.*date', re.I)
+ARTICLE_CONTENT_CLASS_RE = re.compile(r'content|article|detail|body', re.I)
+
+def _class_string(attrs):
+    css_class = attrs.get('class') or ''
+    return css_class if isinstance(css_class, str) else ' '.join(css_class)
+
+# Dữ liệu có cấu trúc trong <head>: JSON-LD và thẻ meta thời gian đăng
+STRUCTURED_DATE_META = {
+    ('property', 'article:published_time'),
+    ('property', 'og:published_time'),
+    ('itemprop', 'datePublished'),
+    ('name', 'pubdate'),
+    ('name', 'publishdate'),
+}
+
+def _is_article_tag(name, attrs):
+    if name in ('p', 'article'):
+        return True
+    if name == 'script':
+        return attrs.get('type') == 'application/ld+json'
+    if name == 'meta' and any(attrs.get(key) == value for key, value in STRUCTURED_DATE_META):
+        return True
+    if name not in ('time', 'span', 'div', 'meta'):
+        return False
+    css_class = _class_string(attrs)
+    if name == 'div' and ARTICLE_CONTENT_CLASS_RE.search(css_class):
+        return True
+    # 'meta.*time' trong fetch_article_content đã nằm trong ARTICLE_DATE_CLASS_RE ('time')
+    return bool(ARTICLE_DATE_CLASS_RE.search(css_class)
+                or attrs.get('itemprop') == 'datePublished'
+                or attrs.get('property') == 'article:published_time'
+                or attrs.get('name') == 'pubdate')
+
+ARTICLE_STRAINER = TagStrainer(_is_article_tag)
+
+SIMPLE_SELECTOR_RE = re.compile(r'([a-z][a-z0-9]*)?(?:([.#])([\w-]+))?')
+
+def parse_simple_selector(selector):
+    """CSS selector đơn giản -> [(tag, '.'|'#'|None, giá trị)]
+
+    Chỉ hỗ trợ 'tag', 'tag.class', 'tag#id', '.class', '#id'; nhiều selector cách
+    nhau bởi dấu phẩy được thử lần lượt theo thứ tự viết.
+    """
+    rules = []
+    for part in selector.split(','):
+        match = SIMPLE_SELECTOR_RE.fullmatch(part.strip())
+        if not match or not any(match.groups()):
+            raise ValueError(f"Selector không hỗ trợ: {part.strip()}")
+        rules.append(match.groups())
+    return rules
+
+def find_first(soup, rules):
+    """Thẻ đầu tiên khớp selector đầu tiên có kết quả - mỗi selector là 1 lần soup.find"""
+    for tag, kind, value in rules:
+        if kind == '.':
+            found = soup.find(tag or True, class_=value)
+        elif kind == '#':
+            found = soup.find(tag or True, id=value)
+        else:
+            found = soup.find(tag)
+        if found is not None:
+            return found
+    return None
+
+def simple_selector_matcher(rules):
+    """match(name, attrs) cho TagStrainer: giữ lại đúng các thẻ mà find_first sẽ tìm"""
+    def matches(name, attrs):
+        for tag, kind, value in rules:
+            if tag and tag != name:
+                continue
+            if kind == '.' and value not in _class_string(attrs).split():
+                continue
+            if kind == '#' and attrs.get('id') != value:
+                continue
+            return True
+        return False
+    return matches
+
+class ArticleEndWatcher(HTMLParser):
+    """Đọc HTML đang tải dần, báo done khi đã qua ngày đăng + thân bài của template
+
+    Dùng khi tải bài theo từng chunk: done -> phần còn lại (script, tin liên quan,
+    footer...) không cần tải nữa. Thân bài chỉ tính là xong khi đã đóng thẻ và có
+    ít nhất 1 đoạn <p> đủ dài, để fetch_article_content không phải quay về cách tìm chung.
+    """
+    def __init__(self, date_match, body_match):
+        super().__init__()
+        self.date_match = date_match
+        self.body_match = body_match
+        self.date_seen = False
+        self.body_tag = None      # tên thẻ thân bài đang mở
+        self.body_depth = 0       # số thẻ cùng tên đang mở bên trong thân bài
+        self.body_closed = False
+        self.body_has_text = False
+        self._p_text_len = None
+        self._in_json_ld = False
+        self.done = False
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if not self.date_seen:
+            if self.date_match(tag, attrs):
+                self.date_seen = True
+            elif tag == 'meta' and attrs.get('content') and any(attrs.get(key) == value for key, value in STRUCTURED_DATE_META):
+                self.date_seen = True
+        if tag == 'script':
+            self._in_json_ld = attrs.get('type') == 'application/ld+json'
+        
+        if self.body_tag is None:
+            if not self.body_closed and self.body_match(tag, attrs):
+                self.body_tag = tag
+                self.body_depth = 1
+        elif tag == self.body_tag:
+            self.body_depth += 1
+        if self.body_tag is not None and tag == 'p':
+            self._p_text_len = 0
+    
+    def handle_data(self, data):
+        if self._in_json_ld and 'datePublished' in data:
+            self.date_seen = True
+        if self._p_text_len is not None:
+            self._p_text_len += len(data.strip())
+    
+    def handle_endtag(self, tag):
+        if tag == 'script':
+            self._in_json_ld = False
+        if tag == 'p' and self._p_text_len is not None:
+            if self._p_text_len > 50:
+                self.body_has_text = True
+            self._p_text_len = None
+        if self.body_tag is not None and tag == self.body_tag:
+            self.body_depth -= 1
+            if self.body_depth == 0:
+                self.body_tag = None
+                self.body_closed = True
+        self.done = self.date_seen and self.body_closed and self.body_has_text
+
+def make_soup(markup, parse_only=None):
+    """Dựng BeautifulSoup bằng HTML_PARSER, chỉ giữ phần thoả parse_only (nếu có)
+
+    parse_only chỉ áp dụng với lxml: lxml tự đóng thẻ thiếu (vd. <p> không có </p>)
+    trước khi báo cho BeautifulSoup, nên cây rút gọn trùng với cây đầy đủ. html.parser
+    thì không - thẻ mở dở có thể "nuốt" phần sau của trang - nên vẫn dựng cả cây.
+
+    Trang có <p> / <div> không đóng vẫn dựng bằng html.parser: 2 parser đóng thẻ thiếu
+    ở chỗ khác nhau - html.parser lồng các <p> vào nhau ('<p>A<p>B' -> <p>A<p>B</p></p>),
+    lxml tách thành các đoạn riêng; <div> thân bài không đóng thì lxml kéo cả cột phải,
+    footer vào thân bài - dùng lxml thì nội dung khác với kết quả trước khi đổi parser.
+    """
+    if not HTML_PARSER.startswith('lxml'):
+        parse_only = None
+    elif has_unclosed_blocks(markup):
+        return BeautifulSoup(markup, 'html.parser')
+    return BeautifulSoup(markup, HTML_PARSER, parse_only=parse_only)
+
+# ============================================================
+# ARTICLE TEXT
+# ============================================================
+
+class ArticleText:
+    """Các dạng chuẩn hoá của 1 bài - tính 1 lần, dùng chung cho mọi bước phân tích
+
+    extract_stock, advanced_summarize, analyze_sentiment và KeywordRiskDetector
+    trước đây mỗi hàm tự lower()/upper()/clean_text() lại toàn bộ bài. Mỗi thuộc
+    tính ở đây chỉ được tính khi cần lần đầu rồi giữ lại cho các bước sau.
+    """
+    CLEAN_CHARS_RE = re.compile(r'[^\w\s.,;:!?()%\-\+\/\"\'àáảãạăắằẳẵặâấầẩẫậèéẻẽẹêếềểễệìíỉĩịòóỏõọôốồổỗộơớờởỡợùúủũụưứừửữựỳýỷỹỵđÀÁẢÃẠĂẮẰẲẴẶÂẤẦẨẪẬÈÉẺẼẸÊẾỀỂỄỆÌÍỈĨỊÒÓỎÕỌÔỐỒỔỖỘƠỚỜỞỠỢÙÚỦŨỤƯỨỪỬỮỰỲÝỶỸỴĐ]')
+    SPACES_RE = re.compile(r'\s+')
+    SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+    NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+    
+    def __init__(self, title, content):
+        self.title = title or ''
+        self.content = content or ''
+    
+    @staticmethod
+    def clean_text(text):
+        """Làm sạch text - từ V1.0"""
+        if not text:
+            return ""
+        text = ArticleText.CLEAN_CHARS_RE.sub(' ', text)
+        text = ArticleText.SPACES_RE.sub(' ', text)
+        return text.strip()
+    
+    @cached_property
+    def raw(self):
+        """Tiêu đề + nội dung (text dùng để tìm mã CK, sentiment, risk)"""
+        return self.title + " " + self.content
+    
+    @cached_property
+    def lower(self):
+        return self.raw.lower()
+    
+    @cached_property
+    def upper(self):
+        return self.raw.upper()
+    
+    @cached_property
+    def words_lower(self):
+        return self.lower.split()
+    
+    @cached_property
+    def clean_title(self):
+        return self.clean_text(self.title)
+    
+    @cached_property
+    def clean_content(self):
+        return self.clean_text(self.content)
+    
+    @cached_property
+    def sentences(self):
+        """Các câu (> 30 ký tự) của tiêu đề + nội dung đã làm sạch - dùng cho tóm tắt"""
+        full_text = self.clean_title + ". " + self.clean_content
+        stripped = (s.strip() for s in self.SENTENCE_SPLIT_RE.split(full_text))
+        return [s for s in stripped if len(s) > 30]
+    
+    @cached_property
+    def sentences_lower(self):
+        return [s.lower() for s in self.sentences]
+    
+    @cached_property
+    def sentences_upper(self):
+        return [s.upper() for s in self.sentences]
+    
+    @cached_property
+    def sentence_numbers(self):
+        """Các số xuất hiện trong từng câu"""
+        return [self.NUMBER_RE.findall(s) for s in self.sentences]
+
 # ============================================================
 # KEYWORD RISK DETECTOR
 # ============================================================
 
+class KeywordTrieMatcher:
+    """Tìm mọi từ khoá trong text chỉ với 1 lần quét (thay cho Aho–Corasick)
+
+    Các từ khoá được gộp thành 1 trie rồi biên dịch thành 1 regex duy nhất
+    (nhánh theo từng ký tự), nên engine `re` (viết bằng C) quét text 1 lần và
+    chi phí không tăng theo số từ khoá. Python chỉ chạy tại các vị trí khớp để
+    liệt kê mọi từ khoá bắt đầu ở đó (kể cả từ khoá là tiền tố của nhau và các
+    lần xuất hiện chồng lấn) - kết quả giống hệt `keyword in text` cho từng từ.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._trie = {}
+        for idx, pattern in enumerate(self.patterns):
+            node = self._trie
+            for ch in pattern:
+                node = node.setdefault(ch, {})
+            node.setdefault(None, []).append(idx)
+        self._regex = re.compile(self._to_regex(self._trie)) if self.patterns else None
+    
+    def _to_regex(self, node):
+        branches = [re.escape(ch) + self._to_regex(child) for ch, child in node.items() if ch is not None]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if None in node:
+            # Nút kết thúc 1 từ khoá: phần sau là tuỳ chọn (greedy -> khớp dài nhất)
+            return '(?:' + body + ')?'
+        return body
+    
+    def finditer(self, text):
+        """Yield (vị trí bắt đầu, index từ khoá) cho mọi lần xuất hiện"""
+        if self._regex is None:
+            return
+        search = self._regex.search
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return
+            start = match.start()
+            # Đi theo trie trên đoạn khớp dài nhất để lấy cả các từ khoá ngắn hơn
+            node = self._trie
+            for ch in text[start:match.end()]:
+                node = node[ch]
+                for idx in node.get(None, ()):
+                    yield start, idx
+            pos = start + 1
+    
+    def search(self, text):
+        """True nếu có ít nhất 1 từ khoá xuất hiện trong text"""
+        return self._regex is not None and self._regex.search(text) is not None
+    
+    def find_first(self, text):
+        """{index từ khoá: vị trí xuất hiện đầu tiên}"""
+        first = {}
+        for start, idx in self.finditer(text):
+            if idx not in first:
+                first[idx] = start
+        return first
+
 class KeywordRiskDetector:
     def __init__(self):
         self.keywords_db = {
@@ -197,35 +631,43 @@ class KeywordRiskDetector:
             "tăng trưởng mạnh": {"category": "Tích cực", "severity": "positive", "score": 65, "violation": ""},
             "doanh thu kỷ lục": {"category": "Tích cực", "severity": "positive", "score": 75, "violation": ""},
         }
+        self.build_matcher()
+    
+    def build_matcher(self):
+        """Biên dịch keywords_db thành bộ so khớp 1 lần quét - gọi lại sau khi sửa keywords_db"""
+        self._keywords = list(self.keywords_db)
+        self._matcher = KeywordTrieMatcher(self._keywords)
     
-    def analyze(self, text):
-        text_lower = text.lower()
+    def analyze(self, text, article_text=None):
+        text_lower = article_text.lower if article_text is not None else text.lower()
         found_keywords = []
         total_score = 0
         categories = set()
         violations = set()
         max_severity = "normal"
         
-        for keyword, info in self.keywords_db.items():
-            if keyword in text_lower:
-                found_keywords.append({
-                    "keyword": keyword,
-                    "category": info["category"],
-                    "severity": info["severity"],
-                    "score": info["score"],
-                    "violation": info["violation"]
-                })
-                total_score += info["score"]
-                categories.add(info["category"])
-                if info["violation"]:
-                    violations.add(info["violation"])
-                
-                if info["severity"] == "severe":
-                    max_severity = "severe"
-                elif info["severity"] == "warning" and max_severity != "severe":
-                    max_severity = "warning"
-                elif info["severity"] == "positive" and max_severity == "normal":
-                    max_severity = "positive"
+        # 1 lần quét cho mọi từ khoá, giữ thứ tự như trong keywords_db
+        for idx in sorted(self._matcher.find_first(text_lower)):
+            keyword = self._keywords[idx]
+            info = self.keywords_db[keyword]
+            found_keywords.append({
+                "keyword": keyword,
+                "category": info["category"],
+                "severity": info["severity"],
+                "score": info["score"],
+                "violation": info["violation"]
+            })
+            total_score += info["score"]
+            categories.add(info["category"])
+            if info["violation"]:
+                violations.add(info["violation"])
+            
+            if info["severity"] == "severe":
+                max_severity = "severe"
+            elif info["severity"] == "warning" and max_severity != "severe":
+                max_severity = "warning"
+            elif info["severity"] == "positive" and max_severity == "normal":
+                max_severity = "positive"
         
         return {
             "keywords": found_keywords,
@@ -234,6 +676,48 @@ class KeywordRiskDetector:
             "categories": list(categories),
             "violations": ", ".join(sorted(violations))
         }
+    
+    def analyze_frame(self, texts_lower):
+        """analyze() cho cả loạt text đã lower() - mỗi từ khoá là 1 lần str.contains trên cả cột
+
+        Trả về DataFrame (cùng index) các cột total_score, severity, keywords (list tên từ khoá
+        theo thứ tự keywords_db), categories (list), violations. Các bài cùng tập từ khoá
+        khớp dùng chung 1 lần dựng keywords / categories / violations.
+        """
+        infos = [self.keywords_db[keyword] for keyword in self._keywords]
+        hits = np.zeros((len(texts_lower), len(self._keywords)), dtype=bool)
+        for col, keyword in enumerate(self._keywords):
+            hits[:, col] = texts_lower.str.contains(keyword, regex=False).to_numpy(dtype=bool)
+        
+        scores = np.array([info["score"] for info in infos], dtype=np.int64)
+        has = {
+            severity: hits[:, [info["severity"] == severity for info in infos]].any(axis=1)
+            for severity in ("severe", "warning", "positive")
+        }
+        severity = np.select([has["severe"], has["warning"], has["positive"]],
+                             ["severe", "warning", "positive"], "normal")
+        
+        patterns, inverse = np.unique(hits, axis=0, return_inverse=True)
+        keywords, categories, violations = [], [], []
+        for pattern in patterns:
+            found = np.flatnonzero(pattern)
+            keywords.append([self._keywords[idx] for idx in found])
+            categories.append(list(dict.fromkeys(infos[idx]["category"] for idx in found)))
+            violations.append(", ".join(sorted({infos[idx]["violation"] for idx in found if infos[idx]["violation"]})))
+        inverse = inverse.reshape(-1)
+        
+        def per_row(values):
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column[inverse]
+        
+        return pd.DataFrame({
+            "total_score": hits @ scores,
+            "severity": severity,
+            "keywords": per_row(keywords),
+            "categories": per_row(categories),
+            "violations": per_row(violations),
+        }, index=texts_lower.index)
 
 # ============================================================
 # SENTIMENT ANALYZER
@@ -245,9 +729,15 @@ class SimpleSentimentAnalyzer:
         self.positive_words = ['tăng', 'tăng trưởng', 'lợi nhuận', 'thành công', 'tốt', 'cao', 'mạnh', 'vượt']
         self.negative_words = ['giảm', 'sụt giảm', 'lỗ', 'thua lỗ', 'khó khăn', 'tiêu cực', 'suy giảm']
     
-    def analyze_sentiment(self, title, content):
-        text = (title + " " + content).lower()
-        keyword_analysis = self.keyword_detector.analyze(title + " " + content)
+    def lexicon_version(self):
+        """Hash của bộ từ khoá risk + từ tích cực / tiêu cực - đổi bộ từ là đổi version"""
+        lexicon = [self.keyword_detector.keywords_db, self.positive_words, self.negative_words]
+        return hashlib.sha1(json.dumps(lexicon, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+    
+    def analyze_sentiment(self, title, content, article_text=None):
+        article_text = article_text or ArticleText(title, content)
+        text = article_text.lower
+        keyword_analysis = self.keyword_detector.analyze(article_text.raw, article_text=article_text)
         
         pos_count = sum(1 for word in self.positive_words if word in text)
         neg_count = sum(1 for word in self.negative_words if word in text)
@@ -289,28 +779,822 @@ class SimpleSentimentAnalyzer:
             "categories": ", ".join(keyword_analysis["categories"]) if keyword_analysis["categories"] else "",
             "violations": keyword_analysis["violations"]
         }
+    
+    def analyze_frame(self, titles, contents):
+        """analyze_sentiment cho cả loạt bài (vd. chấm lại kho sau khi sửa từ khoá) - tính theo cột
+
+        Kết quả từng bài giống analyze_sentiment; riêng keywords là list tên từ khoá và
+        categories là chuỗi theo thứ tự keywords_db. Trả về DataFrame cùng index với titles.
+        """
+        titles = pd.Series(titles, dtype=object)
+        contents = pd.Series(list(contents), index=titles.index, dtype=object)
+        # lower() của Python từng bài (không dùng .str.lower) để khớp từng ký tự với ArticleText.lower;
+        # dtype object: str.contains dùng `in` của Python, nhanh hơn match_substring của Arrow vài lần
+        texts = pd.Series(
+            [f"{title or ''} {content or ''}".lower() for title, content in zip(titles, contents)],
+            index=titles.index, dtype=object
+        )
+        keyword_analysis = self.keyword_detector.analyze_frame(texts)
+        
+        def count_words(words):
+            counts = np.zeros(len(texts), dtype=np.int64)
+            for word in words:
+                counts += texts.str.contains(word, regex=False).to_numpy(dtype=bool)
+            return counts
+        
+        base_score = 50 + count_words(self.positive_words) * 5 - count_words(self.negative_words) * 5
+        total_score = keyword_analysis["total_score"].to_numpy()
+        severity = keyword_analysis["severity"].to_numpy()
+        
+        final_score = np.select(
+            [severity == "severe", severity == "warning", severity == "positive"],
+            [np.minimum(20, base_score + total_score),
+             np.minimum(40, base_score + total_score * 0.7),
+             np.maximum(60, base_score + total_score)],
+            base_score
+        ).astype(float)
+        final_score = np.clip(final_score, 0, 100)
+        
+        label = np.select([final_score >= 60, final_score >= 40], ["Tích cực", "Trung lập"], "Tiêu cực")
+        risk_level = pd.Series(severity).map({
+            "severe": "Nghiêm trọng",
+            "warning": "Cảnh báo",
+            "positive": "Tích cực",
+        }).fillna("Bình thường").to_numpy()
+        
+        return pd.DataFrame({
+            "sentiment_score": np.round(final_score, 1),
+            "sentiment_label": label,
+            "risk_level": risk_level,
+            "keywords": keyword_analysis["keywords"].to_numpy(),
+            "categories": [", ".join(categories) for categories in keyword_analysis["categories"]],
+            "violations": keyword_analysis["violations"].to_numpy(),
+        }, index=titles.index)
 
 # ============================================================
-# STOCK SCRAPER
+# RATE LIMITER
 # ============================================================
 
-class StockScraperWeb:
-    def __init__(self, stock_df, time_filter_hours=24):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept-Language': 'vi-VN,vi;q=0.9,en;q=0.8',
-        }
-        self.all_articles = []
-        self.session = requests.Session()
-        self.time_filter_hours = time_filter_hours
-        
-        self.vietnam_tz = timezone(timedelta(hours=7))
-        self.cutoff_time = datetime.now(self.vietnam_tz) - timedelta(hours=time_filter_hours)
-        
-        self.sentiment_analyzer = SimpleSentimentAnalyzer()
+class DomainRateLimiter:
+    """Giới hạn tốc độ request theo từng domain (token bucket)
+
+    Mỗi domain có 1 "xô" chứa tối đa `burst` token, được nạp lại với tốc độ
+    `requests_per_second`. Mỗi request lấy 1 token, hết token thì chờ.
+    Dùng chung 1 instance cho mọi thread để vẫn lịch sự khi cào song song;
+    tốc độ riêng từng site đặt bằng set_rate trên chính instance đó (xô token giữ nguyên).
+    """
+    def __init__(self, requests_per_second=2.0, burst=4, per_domain=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        # Cấu hình riêng cho từng site: {'cafef.vn': (requests_per_second, burst)}
+        self.per_domain = per_domain or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        return domain[4:] if domain.startswith('www.') else domain
+    
+    def acquire(self, url):
+        """Chờ tới khi domain của url còn token rồi lấy 1 token"""
+        domain = self._domain(url)
+        rate, burst = self.per_domain.get(domain, (self.requests_per_second, self.burst))
+        if rate <= 0:
+            return
         
-        # Load stock list
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(domain, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[domain] = (tokens - 1, now)
+                    return
+                self._buckets[domain] = (tokens, now)
+                wait_time = (1 - tokens) / rate
+            time.sleep(wait_time)
+    
+    def set_rate(self, url, requests_per_second, burst=None):
+        """Đặt tốc độ cho domain của url - mọi lần chạy dùng chung xô token của domain đó"""
+        with self._lock:
+            self.per_domain[self._domain(url)] = (requests_per_second, burst or self.burst)
+
+# ============================================================
+# HTTP SESSION
+# ============================================================
+
+def make_http_session(pool_connections=16, pool_maxsize=32):
+    """requests.Session với pool kết nối đủ cho cào song song
+
+    pool_connections: số host giữ pool riêng, pool_maxsize: số kết nối giữ lại mỗi host
+    (mặc định của requests là 10 - dễ hết khi nhiều worker cùng tải 1 host).
+    Không tự thử lại trong urllib3: fetch_url thử lại 429/5xx / lỗi kết nối, mỗi lần
+    đều lấy token của rate limiter nên không dồn request vào 1 host.
+    """
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    """Session dùng chung cho cả process - các lần bấm cào sau dùng lại kết nối keep-alive đã mở"""
+    return make_http_session()
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    """Rate limiter dùng chung cho cả process - mọi lần chạy / người dùng chung xô token mỗi site
+
+    Tốc độ chọn ở sidebar được đặt cho từng site bằng set_rate (xem StockScraperWeb.run).
+    """
+    return DomainRateLimiter()
+
+# ============================================================
+# HTTP CACHE
+# ============================================================
+
+class HttpDiskCache:
+    """Cache response HTTP trên đĩa, key theo URL
+
+    Mỗi URL gồm 2 file: `<sha1>.body` (HTML gốc) và `<sha1>.json` (ETag,
+    Last-Modified, header, thời điểm lưu). Dùng để phục vụ lại bài viết từ
+    đĩa và gửi request có điều kiện (If-None-Match / If-Modified-Since).
+    meta['truncated']: body bị cắt khi tải theo chunk - chỉ dùng cho lần đọc cũng cắt như vậy.
+
+    Không lớn mãi khi poll liên tục: prune() (chạy khi mở cache và sau mỗi run()) xoá URL
+    lưu quá max_age giây, rồi URL lưu lâu nhất tới khi tổng dung lượng <= max_bytes.
+    """
+    def __init__(self, cache_dir='.scraper_cache/http', max_age=14 * 24 * 3600, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.prune()
+    
+    def _path(self, url, ext):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+    
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def get(self, url):
+        """Trả về (meta, body) hoặc None nếu chưa có trong cache"""
+        try:
+            with open(self._path(url, 'json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self._path(url, 'body'), 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+    
+    def put(self, url, response):
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'etag', 'last-modified')},
+            'stored_at': time.time(),
+            'truncated': getattr(response, 'truncated', False),
+        }
+        self._write_atomic(self._path(url, 'body'), response.content)
+        self._write_atomic(self._path(url, 'json'), json.dumps(meta).encode('utf-8'))
+    
+    def touch(self, url, meta):
+        """Server trả 304 - body vẫn đúng, chỉ làm mới thời điểm lưu"""
+        meta = dict(meta, stored_at=time.time())
+        self._write_atomic(self._path(url, 'json'), json.dumps(meta).encode('utf-8'))
+    
+    def prune(self):
+        """Xoá URL quá max_age, rồi URL cũ nhất tới khi <= max_bytes - trả về số URL đã xoá
+
+        Thời điểm lưu lấy theo mtime của file .json (put / touch đều ghi lại file này), không
+        cần đọc từng file. File .body / .json lẻ (ghi dở, xoá dở) cũng bị xoá.
+        """
+        entries = {}  # key -> [mtime file .json hoặc None, tổng byte, các file]
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                key, ext = os.path.splitext(item.name)
+                if ext not in ('.body', '.json') or not item.is_file():
+                    continue
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entry = entries.setdefault(key, [None, 0, []])
+                if ext == '.json':
+                    entry[0] = stat.st_mtime
+                entry[1] += stat.st_size
+                entry[2].append(item.path)
+        
+        cutoff = time.time() - self.max_age
+        removed = [key for key, (mtime, _, files) in entries.items() if mtime is None or len(files) < 2 or mtime < cutoff]
+        kept = sorted((entries[key][0], entries[key][1], key) for key in set(entries) - set(removed))
+        total = sum(size for _, size, _ in kept)
+        for _, size, key in kept:
+            if total <= self.max_bytes:
+                break
+            removed.append(key)
+            total -= size
+        for key in removed:
+            for path in entries[key][2]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(removed)
+    
+    @staticmethod
+    def to_response(meta, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = meta['url']
+        response.headers.update(meta.get('headers', {}))
+        response._content = body
+        response.from_cache = True
+        response.truncated = meta.get('truncated', False)
+        return response
+
+# ============================================================
+# SEEN ARTICLE STORE (INCREMENTAL)
+# ============================================================
+
+class SeenArticleStore:
+    """Lưu các link bài viết đã xử lý cùng kết quả phân tích (SQLite)
+
+    Dùng cho chế độ incremental: link đã có trong store sẽ không tải lại mà
+    dùng luôn dòng kết quả cũ. result = None nghĩa là bài đã xử lý nhưng không
+    tìm thấy mã CK. analysis_key ghi lại danh sách mã + bộ từ khoá lúc phân tích;
+    khác key hiện tại thì bài phải phân tích lại.
+
+    Link đã tải nhưng không phân tích cũng được lưu (status), để lần poll sau không tải lại:
+    'too_old' - bài đăng trước mốc lọc thời gian; 'failed' - không tải được / không có nội
+    dung hoặc ngày đăng (được thử lại sau 1 khoảng, xem StockScraperWeb.SEEN_RETRY_SECONDS).
+    """
+    STATUSES = ('analyzed', 'too_old', 'failed')
+    
+    def __init__(self, db_path='.scraper_cache/seen_articles.db'):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_articles (
+                    link TEXT PRIMARY KEY,
+                    title TEXT,
+                    date TEXT,
+                    date_iso TEXT,
+                    result TEXT,
+                    processed_at REAL,
+                    analysis_key TEXT,
+                    status TEXT DEFAULT 'analyzed'
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(seen_articles)")}
+            if 'analysis_key' not in columns:
+                # Store cũ: chưa có key -> mọi dòng cũ sẽ được phân tích lại
+                self._conn.execute("ALTER TABLE seen_articles ADD COLUMN analysis_key TEXT")
+            if 'status' not in columns:
+                # Store cũ chỉ lưu bài đã phân tích
+                self._conn.execute("ALTER TABLE seen_articles ADD COLUMN status TEXT DEFAULT 'analyzed'")
+    
+    def get_many(self, links):
+        """Trả về {link: {'title', 'date', 'date_obj', 'result', 'analysis_key', 'status', 'processed_at'}}
+
+        date_obj = None với link 'failed' không đọc được ngày đăng.
+        """
+        found = {}
+        links = list(links)
+        with self._lock:
+            for i in range(0, len(links), 500):
+                chunk = links[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT link, title, date, date_iso, result, analysis_key, status, processed_at "
+                    f"FROM seen_articles WHERE link IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for link, title, date, date_iso, result, analysis_key, status, processed_at in rows:
+                    found[link] = {
+                        'title': title,
+                        'date': date,
+                        'date_obj': datetime.fromisoformat(date_iso) if date_iso else None,
+                        'result': json.loads(result) if result else None,
+                        'analysis_key': analysis_key,
+                        'status': status,
+                        'processed_at': processed_at,
+                    }
+        return found
+    
+    def save(self, article, result, analysis_key=None, status='analyzed'):
+        """Lưu 1 link - status khác 'analyzed' thì result / analysis_key bỏ trống, date_obj có thể None"""
+        if status not in self.STATUSES:
+            raise ValueError(f"status phải là một trong {self.STATUSES}")
+        date_obj = article.get('date_obj')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seen_articles "
+                "(link, title, date, date_iso, result, processed_at, analysis_key, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (article['link'], article['title'], article.get('date'), date_obj.isoformat() if date_obj else None,
+                 json.dumps(result, ensure_ascii=False) if result else None, time.time(), analysis_key, status)
+            )
+
+# ============================================================
+# ARTICLE STORE (SQLITE + FTS5)
+# ============================================================
+
+class ArticleStore:
+    """Kho bài viết lâu dài (SQLite) - tra cứu lịch sử tại máy, không cần cào lại
+
+    Mỗi dòng kết quả của scrape_source được lưu kèm nội dung bài và thời điểm đăng.
+    Chỉ mục FTS5 trên tiêu đề + nội dung cho tìm kiếm toàn văn (không dấu vẫn khớp);
+    bản SQLite không có FTS5 thì tìm bằng LIKE.
+    """
+    # Cột kết quả của scrape_source -> cột trong bảng articles
+    COLUMNS = {
+        'Link': 'link',
+        'Tiêu đề': 'title',
+        'Ngày': 'date',
+        'Mã CK': 'code',
+        'Tên công ty': 'company',
+        'Sàn': 'exchange',
+        'Sentiment': 'sentiment',
+        'Điểm': 'score',
+        'Risk': 'risk',
+        'Vi phạm': 'violations',
+        'Keywords': 'keywords',
+        'Nội dung tóm tắt': 'summary',
+        'Tìm theo': 'match_method',
+    }
+    VIETNAM_TZ = timezone(timedelta(hours=7))
+
+    def __init__(self, db_path='.scraper_cache/articles.db'):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    id INTEGER PRIMARY KEY,
+                    link TEXT UNIQUE,
+                    title TEXT,
+                    date TEXT,
+                    code TEXT,
+                    company TEXT,
+                    exchange TEXT,
+                    sentiment TEXT,
+                    score REAL,
+                    risk TEXT,
+                    violations TEXT,
+                    keywords TEXT,
+                    summary TEXT,
+                    match_method TEXT,
+                    published TEXT,
+                    content TEXT,
+                    stored_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_published ON articles (published)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_code ON articles (code, published)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_risk ON articles (risk, published)")
+            self.fts = self._create_fts()
+
+    def _create_fts(self):
+        """Bảng FTS5 (external content) + trigger đồng bộ - trả về False nếu SQLite không có FTS5"""
+        for tokenizer in ("unicode61 remove_diacritics 2", "unicode61"):
+            try:
+                self._conn.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                        title, content, content='articles', content_rowid='id', tokenize='{tokenizer}'
+                    )
+                """)
+                break
+            except sqlite3.OperationalError:
+                continue
+        else:
+            return False
+        # Chỉ đánh chỉ mục lại khi tiêu đề / nội dung đổi (rescore không đụng tới FTS)
+        self._conn.executescript("""
+            DROP TRIGGER IF EXISTS articles_au;
+            CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+                INSERT INTO articles_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+                INSERT INTO articles_fts (articles_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            END;
+            CREATE TRIGGER articles_au AFTER UPDATE OF title, content ON articles BEGIN
+                INSERT INTO articles_fts (articles_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+                INSERT INTO articles_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+        """)
+        return True
+
+    def save(self, article, row):
+        """Lưu 1 bài (article của scrape_source + dòng kết quả) - link đã có thì cập nhật"""
+        columns = list(self.COLUMNS.values()) + ['published', 'content', 'stored_at']
+        values = [row.get(key) for key in self.COLUMNS] + [
+            article['date_obj'].astimezone(self.VIETNAM_TZ).isoformat(), article.get('content'), time.time()
+        ]
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'link')
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO articles ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (link) DO UPDATE SET {updates}",
+                values
+            )
+
+    @staticmethod
+    def _fts_query(text):
+        """Từ khoá người dùng -> truy vấn FTS5: mỗi từ trong ngoặc kép (AND), tránh lỗi cú pháp"""
+        return ' '.join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+    def search(self, text=None, code=None, exchange=None, risk=None, since=None, until=None, limit=500):
+        """DataFrame các bài khớp điều kiện (cột như kết quả run(), thêm 'Ngày đăng'), mới nhất trước
+
+        text: tìm toàn văn trong tiêu đề + nội dung; since / until: datetime giới hạn thời điểm đăng.
+        """
+        where, params = [], []
+        source = "articles a"
+        if text and text.split():
+            if self.fts:
+                source = "articles_fts JOIN articles a ON a.id = articles_fts.rowid"
+                where.append("articles_fts MATCH ?")
+                params.append(self._fts_query(text))
+            else:
+                for term in text.split():
+                    where.append("(a.title LIKE ? OR a.content LIKE ?)")
+                    params += [f"%{term}%"] * 2
+        for column, value in (('code', code and code.upper()), ('exchange', exchange), ('risk', risk)):
+            if value:
+                where.append(f"a.{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("a.published >= ?")
+            params.append(since.astimezone(self.VIETNAM_TZ).isoformat())
+        if until is not None:
+            where.append("a.published < ?")
+            params.append(until.astimezone(self.VIETNAM_TZ).isoformat())
+
+        select = ', '.join(f"a.{column}" for column in self.COLUMNS.values())
+        sql = f"SELECT {select}, a.published FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY a.published DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=list(self.COLUMNS) + ['Ngày đăng'])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def rescore(self, analyzer, batch_size=5000):
+        """Chấm lại Sentiment / Điểm / Risk / Vi phạm / Keywords mọi bài trong kho - trả về số bài
+
+        Dùng sau khi sửa từ khoá / bộ từ: mỗi lô batch_size bài chấm bằng analyzer.analyze_frame.
+        Chỉ cập nhật bảng articles - dataset Parquet (ResultDataset) là log chỉ ghi thêm, giữ
+        nguyên điểm của lần chạy đã ghi (không có nội dung bài để chấm lại).
+        """
+        last_id, total = 0, 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, title, content FROM articles WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return total
+            ids, titles, contents = zip(*rows)
+            result = analyzer.analyze_frame(titles, contents)
+            updates = zip(
+                result['sentiment_label'], result['sentiment_score'].astype(float), result['risk_level'],
+                result['violations'], ["; ".join(keywords[:3]) for keywords in result['keywords']], ids
+            )
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "UPDATE articles SET sentiment = ?, score = ?, risk = ?, violations = ?, keywords = ? WHERE id = ?",
+                    updates
+                )
+            last_id = ids[-1]
+            total += len(rows)
+
+@st.cache_resource(show_spinner=False)
+def get_article_store():
+    """Kho bài viết dùng chung cho cả process (1 kết nối SQLite, có khoá)"""
+    return ArticleStore()
+
+# ============================================================
+# PARQUET DATASET (PHÂN TÍCH)
+# ============================================================
+
+class ResultDataset:
+    """Dataset Parquet của mọi lần chạy - phân vùng theo ngày đăng và Sàn
+
+    Mỗi lần run() ghi thêm 1 file / phân vùng: <root>/ngay=YYYY-MM-DD/Sàn=HNX/run-....parquet.
+    Mã CK / Risk / Sentiment / Tìm theo lưu dạng dictionary (category khi đọc vào pandas).
+    Chỉ ghi thêm, không sửa file cũ: mỗi dòng giữ Sentiment / Điểm / Risk / Vi phạm / Keywords
+    đúng như lúc chạy (cột 'Lần chạy') - ArticleStore.rescore không cập nhật dataset. Cần điểm
+    theo bộ từ khoá hiện tại thì dùng kho bài viết (articles.db).
+    Đọc bằng DuckDB: SELECT * FROM read_parquet('.scraper_cache/results/**/*.parquet', hive_partitioning = true)
+    """
+    VIETNAM_TZ = timezone(timedelta(hours=7))
+    DATE_FORMAT = '%d/%m/%Y %H:%M'
+    SCHEMA = pa.schema([
+        ('Tiêu đề', pa.string()),
+        ('Link', pa.string()),
+        ('Ngày', pa.string()),
+        ('Ngày đăng', pa.timestamp('us', tz='+07:00')),
+        ('Mã CK', pa.dictionary(pa.int32(), pa.string())),
+        ('Tên công ty', pa.string()),
+        ('Sentiment', pa.dictionary(pa.int32(), pa.string())),
+        ('Điểm', pa.float64()),
+        ('Risk', pa.dictionary(pa.int32(), pa.string())),
+        ('Vi phạm', pa.string()),
+        ('Keywords', pa.string()),
+        ('Nội dung tóm tắt', pa.string()),
+        ('Tìm theo', pa.dictionary(pa.int32(), pa.string())),
+        ('Lần chạy', pa.timestamp('us', tz='+07:00')),
+        ('ngay', pa.date32()),
+        ('Sàn', pa.string()),
+    ])
+    PARTITIONING = ds.partitioning(pa.schema([('ngay', pa.date32()), ('Sàn', pa.string())]), flavor='hive')
+
+    def __init__(self, root='.scraper_cache/results'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, df, run_at=None):
+        """Ghi thêm kết quả 1 lần chạy (DataFrame của run()) - trả về số dòng đã ghi"""
+        if df is None or len(df) == 0:
+            return 0
+        run_at = run_at or datetime.now(self.VIETNAM_TZ)
+        data = df.drop(columns=['STT'], errors='ignore')
+        # Ngày đăng đọc lại từ cột 'Ngày'; không đọc được thì xếp vào ngày chạy
+        published = pd.to_datetime(data['Ngày'], format=self.DATE_FORMAT, errors='coerce').dt.tz_localize(self.VIETNAM_TZ)
+        published = published.fillna(pd.Timestamp(run_at))
+        data = data.assign(**{'Ngày đăng': published, 'Lần chạy': pd.Timestamp(run_at), 'ngay': published.dt.date})
+        table = pa.Table.from_pandas(data, schema=self.SCHEMA, preserve_index=False)
+        ds.write_dataset(
+            table, self.root, format='parquet', partitioning=self.PARTITIONING,
+            basename_template=f"run-{run_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore'
+        )
+        return table.num_rows
+
+    def load(self, since=None, until=None, columns=None, latest_only=True):
+        """Đọc kết quả vào pandas, chỉ quét các phân vùng ngày trong [since, until]
+
+        since / until: date hoặc datetime theo ngày đăng. latest_only: link xuất hiện ở
+        nhiều lần chạy thì chỉ giữ dòng của lần chạy mới nhất.
+        """
+        dataset = ds.dataset(self.root, format='parquet', partitioning=self.PARTITIONING, schema=self.SCHEMA)
+        # Lọc theo phân vùng 'ngay' (bỏ qua cả thư mục), datetime thì lọc thêm đúng tới giờ đăng
+        clauses = []
+        for bound, op in ((since, '__ge__'), (until, '__le__')):
+            if isinstance(bound, datetime):
+                bound = bound.astimezone(self.VIETNAM_TZ)
+                clauses += [getattr(ds.field('ngay'), op)(bound.date()), getattr(ds.field('Ngày đăng'), op)(bound)]
+            elif bound is not None:
+                clauses.append(getattr(ds.field('ngay'), op)(bound))
+        condition = None
+        for clause in clauses:
+            condition = clause if condition is None else condition & clause
+        if columns is not None and latest_only:
+            columns = list(dict.fromkeys(list(columns) + ['Link', 'Lần chạy']))
+        df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+        if 'Sàn' in df.columns:
+            df['Sàn'] = df['Sàn'].astype('category')
+        if latest_only and len(df):
+            df = df.sort_values('Lần chạy').drop_duplicates(subset=['Link'], keep='last')
+        if 'Ngày đăng' in df.columns:
+            df = df.sort_values('Ngày đăng', ascending=False)
+        return df.reset_index(drop=True)
+
+@st.cache_resource(show_spinner=False)
+def get_result_dataset():
+    return ResultDataset()
+
+# ============================================================
+# RESPONSE ARCHIVE (RECORD / REPLAY)
+# ============================================================
+
+class ResponseArchive:
+    """Ghi lại / phát lại mọi response của fetch_url (SQLite, body nén zlib)
+
+    mode='record': cào bình thường, lưu từng response (URL, status, header, body).
+    Mở ở chế độ record là bắt đầu bản ghi mới - xoá response + mốc thời gian cũ để
+    replay không trộn trang của nhiều lần ghi dưới cùng 1 mốc "bây giờ".
+    mode='replay': không ra mạng - fetch_url lấy response từ archive, nên run()
+    chạy lại đúng dữ liệu cũ (benchmark, so sánh thay đổi trích xuất). Thời điểm
+    ghi được lưu làm mốc "bây giờ" để bộ lọc thời gian cho kết quả giống hệt.
+    """
+    MODES = ('record', 'replay')
+    
+    def __init__(self, db_path='.scraper_cache/archive.db', mode='replay'):
+        if mode not in self.MODES:
+            raise ValueError(f"mode phải là một trong {self.MODES}")
+        self.mode = mode
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER,
+                    headers TEXT,
+                    body BLOB,
+                    recorded_at REAL,
+                    truncated INTEGER DEFAULT 0
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+            if 'truncated' not in columns:
+                self._conn.execute("ALTER TABLE responses ADD COLUMN truncated INTEGER DEFAULT 0")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS archive_meta (key TEXT PRIMARY KEY, value TEXT)")
+            if mode == 'record':
+                self._conn.execute("DELETE FROM responses")
+                self._conn.execute("DELETE FROM archive_meta")
+    
+    def record(self, url, response):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, status, headers, body, recorded_at, truncated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, response.status_code, json.dumps(dict(response.headers)),
+                 zlib.compress(response.content), time.time(), int(getattr(response, 'truncated', False)))
+            )
+    
+    def replay(self, url):
+        """Response đã ghi cho url, hoặc None nếu lúc ghi không tải được"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body, truncated FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, truncated = row
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.headers.update(json.loads(headers))
+        response._content = zlib.decompress(body)
+        response.from_archive = True
+        response.truncated = bool(truncated)
+        return response
+    
+    def urls(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT url FROM responses ORDER BY url")]
+    
+    def set_reference_time(self, when):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO archive_meta VALUES ('reference_time', ?)", (when.isoformat(),)
+            )
+    
+    def reference_time(self):
+        """Thời điểm của lần ghi gần nhất (datetime có múi giờ) hoặc None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM archive_meta WHERE key = 'reference_time'").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+# ============================================================
+# RUN DIAGNOSTICS
+# ============================================================
+
+class RunDiagnostics:
+    """Đo 1 lần chạy theo từng nguồn: thời gian từng bước, byte tải, status HTTP, retry, cache
+
+    Nguồn đang xử lý gắn theo thread (bind): scrape_source gắn nguồn của nó, worker
+    tải bài gắn lại nguồn của trang danh sách. Thời gian các bước chạy song song là
+    tổng cộng dồn của các worker nên có thể lớn hơn thời gian thực của nguồn ('total').
+    """
+    STAGES = {
+        'listing_fetch': 'Tải danh sách (s)',
+        'listing_parse': 'Parse danh sách (s)',
+        'article_fetch': 'Tải bài (s)',
+        'article_parse': 'Parse bài (s)',
+        'analyze': 'Phân tích (s)',
+    }
+    # Nguồn gốc response: mạng, cache còn hạn, cache được server xác nhận (304), archive
+    ORIGINS = ('network', 'cache', 'not_modified', 'archive')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started = time.perf_counter()
+        self.first_result_s = None
+        self.sources = {}
+
+    def bind(self, source):
+        self._local.source = source
+
+    @property
+    def source(self):
+        return getattr(self._local, 'source', None) or 'Khác'
+
+    def _entry(self, source):
+        entry = self.sources.get(source)
+        if entry is None:
+            entry = {
+                'stages': {},
+                'requests': 0,
+                'bytes': 0,
+                'status': {},
+                'retries': 0,
+                **{origin: 0 for origin in self.ORIGINS},
+            }
+            self.sources[source] = entry
+        return entry
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            stages = self._entry(self.source)['stages']
+            stage = stages.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+            stage['count'] += 1
+            stage['total_s'] += seconds
+            stage['max_s'] = max(stage['max_s'], seconds)
+
+    def result_added(self):
+        """Ghi thời điểm có dòng kết quả đầu tiên (time-to-first-result)"""
+        if self.first_result_s is None:
+            self.first_result_s = time.perf_counter() - self.started
+    
+    def record_response(self, status, size=0, origin='network', retries=0):
+        """status: mã HTTP, hoặc tên exception khi không nhận được response"""
+        with self._lock:
+            entry = self._entry(self.source)
+            entry['requests'] += 1
+            entry['bytes'] += size
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+            entry['retries'] += retries
+            entry[origin] += 1
+
+    def summary(self):
+        """Bản chụp dạng dict (lưu được vào stats / session_state)"""
+        with self._lock:
+            sources = json.loads(json.dumps(self.sources))
+        return {'wall_s': time.perf_counter() - self.started, 'first_result_s': self.first_result_s, 'sources': sources}
+
+    @classmethod
+    def table(cls, summary):
+        """DataFrame 1 dòng / nguồn cho panel Diagnostics"""
+        rows = []
+        for source, entry in summary['sources'].items():
+            stages = entry['stages']
+            row = {'Nguồn': source, 'Thời gian (s)': stages.get('total', {}).get('total_s', 0.0)}
+            for stage, label in cls.STAGES.items():
+                row[label] = stages.get(stage, {}).get('total_s', 0.0)
+            row.update({
+                'Request': entry['requests'],
+                'MB': entry['bytes'] / 1024 / 1024,
+                'Status': ', '.join(f"{status}×{n}" for status, n in sorted(entry['status'].items())),
+                'Retry': entry['retries'],
+                'Cache': entry['cache'] + entry['not_modified'],
+                'Archive': entry['archive'],
+            })
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        if len(df):
+            df = df.sort_values('Thời gian (s)', ascending=False).round(3)
+        return df
+
+# ============================================================
+# STOCK UNIVERSE
+# ============================================================
+
+class StockUniverse:
+    """Danh sách mã CK + các chỉ mục tra cứu của StockScraperWeb, dựng 1 lần
+
+    Chỉ đọc sau khi dựng nên nhiều scraper / job dùng chung được (xem get_stock_universe).
+    key: hash nội dung danh sách mã - kết quả phân tích cũ chỉ dùng lại khi key không đổi.
+    """
+    def __init__(self, stock_df):
         self.stock_df = stock_df
+        self.key = hashlib.sha1(pd.util.hash_pandas_object(stock_df, index=False).values.tobytes()).hexdigest()[:12]
         self.hnx_stocks = set(stock_df[stock_df['Sàn'] == 'HNX']['Mã CK'].tolist())
         self.upcom_stocks = set(stock_df[stock_df['Sàn'] == 'UPCoM']['Mã CK'].tolist())
         
@@ -332,6 +1616,144 @@ class StockScraperWeb:
         for code in self.upcom_stocks:
             self.stock_to_exchange[code] = 'UPCoM'
         
+        # Tóm tắt cộng điểm cho câu chứa mã HNX/UPCoM bất kỳ - 1 lần quét thay vì lặp từng mã
+        self.summary_code_matcher = KeywordTrieMatcher(sorted(self.hnx_stocks | self.upcom_stocks))
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_stock_universe(stock_key, _stock_df):
+    """StockUniverse dùng chung theo khoá danh sách mã (hash file upload / 'default')"""
+    return StockUniverse(_stock_df)
+
+# ============================================================
+# STOCK SCRAPER
+# ============================================================
+
+class StockScraperWeb:
+    # Nguồn có trang danh sách xếp bài mới nhất lên đầu - được dừng sớm khi gặp bài cũ
+    NEWEST_FIRST_SOURCES = {'CafeF', 'VietStock'}
+    
+    # Class của thẻ thời gian cạnh link trên trang danh sách (giống scrape_cafef ở V1.0)
+    LISTING_DATE_CLASSES = ['time', 'date', 'timeago', 'time-ago', 'news-time']
+    # Nhãn cả ngày không có giờ ("hôm qua 6h" hay "hôm qua 23h" đều ra cùng 1 nhãn) - không dùng để lọc
+    RELATIVE_DAY_LABELS = ('hôm nay', 'hôm qua', 'today', 'yesterday')
+    
+    # ArticleEndWatcher (HTMLParser thuần Python) chỉ đọc chừng này byte đầu của bài
+    WATCHER_MAX_BYTES = 256 * 1024
+    
+    # Thử lại trong fetch_url: status nào, chờ bao lâu (backoff tăng dần, Retry-After tối đa)
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    RETRY_BACKOFF = 0.5
+    MAX_RETRY_AFTER = 30
+    
+    # Incremental: link 'failed' trong seen store (không tải được / thiếu nội dung, ngày đăng)
+    # được tải lại sau chừng này giây
+    SEEN_RETRY_SECONDS = 3600
+    
+    # Ngày giờ ISO 8601 (JSON-LD, meta, thẻ <time datetime>)
+    ISO_DATETIME_RE = re.compile(
+        r'(\d{4})-(\d{2})-(\d{2})(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?'
+    )
+    # Giờ trong chuỗi ngày: 14:30, 14h30, 08:33 AM
+    TIME_OF_DAY_RE = re.compile(r'\b(\d{1,2})[:hH](\d{2})\b(?:\s*([AaPp][Mm])\b)?')
+    
+    # Selector chính xác cho ngày đăng / thân bài theo từng host trong run() -
+    # 1 lần tìm theo tên thẻ + class/id thay cho cả chuỗi soup.find dò class bằng regex.
+    # Không khớp (trang đổi giao diện) thì quay về cách tìm chung.
+    # Tiêu đề lấy từ link trên trang danh sách nên không cần selector.
+    SOURCE_TEMPLATES = {
+        'cafef.vn': {'date': 'span.pdate', 'body': 'div.detail-content'},
+        'vietstock.vn': {'date': 'span.datenew, span.date', 'body': 'div#vst_detail'},
+        'nguoiquansat.vn': {'date': 'span.sc-longform-header-date, span.c-detail-head__time',
+                            'body': 'div.entry, div.c-news-detail'},
+        'baomoi.com': {'date': 'time', 'body': 'div.content-body, div.article__body'},
+        'tinnhanhchungkhoan.vn': {'date': 'time.time, span.time', 'body': 'div.article__body'},
+    }
+    
+    def __init__(self, stock_df, time_filter_hours=24, max_workers=8, per_host_limit=3, rate_limiter=None,
+                 http_cache=None, article_cache_ttl=7 * 24 * 3600, seen_store=None, max_page_bytes=2 * 1024 * 1024,
+                 session=None, archive=None, reference_time=None, article_store=None, result_dataset=None,
+                 universe=None, requests_per_second=None):
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept-Language': 'vi-VN,vi;q=0.9,en;q=0.8',
+        }
+        self.all_articles = []
+        # Truyền session dùng chung (get_http_session) để giữ kết nối giữa các lần chạy
+        self.session = session or make_http_session()
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
+        # Tốc độ cho các site nguồn (tuỳ chọn) - đặt trên rate_limiter dùng chung khi run()
+        self.requests_per_second = requests_per_second
+        
+        # Cache trên đĩa (tuỳ chọn): bài viết dùng lại trong article_cache_ttl giây,
+        # trang danh sách luôn được kiểm tra lại bằng request có điều kiện
+        self.http_cache = http_cache
+        self.article_cache_ttl = article_cache_ttl
+        
+        # Bài viết được tải theo từng chunk, dừng khi đủ dữ liệu hoặc quá max_page_bytes
+        self.max_page_bytes = max_page_bytes
+        
+        # Chế độ incremental (tuỳ chọn): bỏ qua link đã xử lý ở các lần chạy trước
+        self.seen_store = seen_store
+        self.time_filter_hours = time_filter_hours
+        
+        # Kho bài viết (tuỳ chọn): lưu mọi dòng kết quả mới để tra cứu lịch sử
+        self.article_store = article_store
+        # Dataset Parquet (tuỳ chọn): mỗi lần run() ghi thêm kết quả để phân tích
+        self.result_dataset = result_dataset
+        
+        # Template đã biên dịch: selector + strainer giữ thẻ của template và thẻ cho cách tìm chung
+        self._templates = {}
+        for host, template in self.SOURCE_TEMPLATES.items():
+            rules = {key: parse_simple_selector(template[key]) for key in ('date', 'body')}
+            template_matchers = [simple_selector_matcher(rule) for rule in rules.values()]
+            strainer = TagStrainer(
+                lambda name, attrs, matchers=template_matchers:
+                    _is_article_tag(name, attrs) or any(m(name, attrs) for m in matchers)
+            )
+            self._templates[host] = (rules, strainer)
+        
+        # Tải song song: tổng số worker + số kết nối đồng thời tối đa tới 1 host
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+        
+        # Khoá cho all_articles / stats / errors khi cào song song nhiều nguồn
+        self._lock = threading.Lock()
+        self.errors = []
+        
+        # Thời gian / byte / status HTTP theo nguồn và bước - xem stats['diagnostics'] sau run()
+        self.diagnostics = RunDiagnostics()
+        
+        self.vietnam_tz = timezone(timedelta(hours=7))
+        
+        # Ghi / phát lại (tuỳ chọn): phát lại thì "bây giờ" là thời điểm đã ghi
+        self.archive = archive
+        if reference_time is None and archive is not None and archive.mode == 'replay':
+            reference_time = archive.reference_time()
+        self.reference_time = reference_time
+        now = self._now()
+        if archive is not None and archive.mode == 'record':
+            archive.set_reference_time(now)
+        
+        self.cutoff_time = now - timedelta(hours=time_filter_hours)
+        
+        self.sentiment_analyzer = SimpleSentimentAnalyzer()
+        
+        # Load stock list - chỉ mục dựng sẵn (get_stock_universe) thì dùng lại, không dựng lại
+        if universe is None:
+            universe = StockUniverse(stock_df)
+        self.stock_df = universe.stock_df
+        self.stock_key = universe.key
+        self.hnx_stocks = universe.hnx_stocks
+        self.upcom_stocks = universe.upcom_stocks
+        self.code_to_name = universe.code_to_name
+        self.name_to_code = universe.name_to_code
+        self.stock_to_exchange = universe.stock_to_exchange
+        
+        self._compile_stock_patterns()
+        self._summary_code_matcher = universe.summary_code_matcher
+        
         self.stats = {
             'total_crawled': 0,
             'hnx_found': 0,
@@ -339,28 +1761,23 @@ class StockScraperWeb:
             'severe_risk': 0,
             'warning_risk': 0,
             'found_by_code': 0,
-            'found_by_name': 0
+            'found_by_name': 0,
+            'skipped_by_listing_date': 0
         }
     
     def clean_text(self, text):
         """Làm sạch text - từ V1.0"""
-        if not text:
-            return ""
-        text = re.sub(r'[^\w\s.,;:!?()%\-\+\/\"\'àáảãạăắằẳẵặâấầẩẫậèéẻẽẹêếềểễệìíỉĩịòóỏõọôốồổỗộơớờởỡợùúủũụưứừửữựỳýỷỹỵđÀÁẢÃẠĂẮẰẲẴẶÂẤẦẨẪẬÈÉẺẼẸÊẾỀỂỄỆÌÍỈĨỊÒÓỎÕỌÔỐỒỔỖỘƠỚỜỞỠỢÙÚỦŨỤƯỨỪỬỮỰỲÝỶỸỴĐ]', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        return ArticleText.clean_text(text)
     
-    def advanced_summarize(self, content, title, max_sentences=4):
+    def advanced_summarize(self, content, title, max_sentences=4, article_text=None):
         """Tóm tắt EXTRACTIVE - từ V1.0"""
-        content = self.clean_text(content)
-        title = self.clean_text(title)
+        article_text = article_text or ArticleText(title, content)
+        content = article_text.clean_content
         
         if not content or len(content) < 100:
             return content
         
-        full_text = title + ". " + content
-        sentences = re.split(r'[.!?]+', full_text)
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 30]
+        sentences = article_text.sentences
         
         if len(sentences) <= max_sentences:
             return '. '.join(sentences) + '.'
@@ -379,7 +1796,7 @@ class StockScraperWeb:
         scored_sentences = []
         for i, sentence in enumerate(sentences):
             score = 0
-            sentence_lower = sentence.lower()
+            sentence_lower = article_text.sentences_lower[i]
             
             if i == 0:
                 score += 5
@@ -392,7 +1809,7 @@ class StockScraperWeb:
                 if keyword in sentence_lower:
                     score += weight
             
-            numbers = re.findall(r'\d+(?:[.,]\d+)*', sentence)
+            numbers = article_text.sentence_numbers[i]
             if numbers:
                 score += len(numbers)
                 if any(num for num in numbers if len(num.replace('.', '').replace(',', '')) >= 4):
@@ -407,10 +1824,8 @@ class StockScraperWeb:
             elif word_count < 8 or word_count > 50:
                 score -= 1
             
-            for code in list(self.hnx_stocks) + list(self.upcom_stocks):
-                if code in sentence.upper():
-                    score += 3
-                    break
+            if self._summary_code_matcher.search(article_text.sentences_upper[i]):
+                score += 3
             
             scored_sentences.append((sentence, score, i))
         
@@ -450,73 +1865,83 @@ class StockScraperWeb:
         
         return False
     
-    def extract_stock(self, text):
-        """Trích xuất mã CK - NÂNG CAO: YÊU CẦU TÍN HIỆU NHẬN DIỆN"""
-        text_upper = text.upper()
-        text_lower = text.lower()
-        
-        # ============================================================
-        # DANH SÁCH MÃ "NGUY HIỂM" - CHỈ NHẬN DIỆN KHI CÓ TÍN HIỆU RÕ RÀNG
-        # ============================================================
-        RISKY_CODES = {'THU', 'TIN', 'TOP', 'HAI', 'LAI', 'CEO', 'CCP'}
-        
-        # ============================================================
-        # BƯỚC 1: TÌM THEO CÁC PATTERN RÕ RÀNG (ƯU TIÊN CAO NHẤT)
-        # ============================================================
-        
-        # Pattern nhóm 1: Trong ngoặc với sàn
-        patterns_with_exchange = [
+    def _compile_stock_patterns(self):
+        """Biên dịch 1 lần các pattern nhận diện mã CK dùng trong extract_stock"""
+        # BƯỚC 1: các pattern rõ ràng, theo thứ tự ưu tiên
+        signal_patterns = [
+            # Nhóm 1: Trong ngoặc với sàn
             r'\((?:UPCOM|HNX):\s*([A-Z]{3})\)',           # (UPCOM: ABC), (HNX: ABC)
             r'\(([A-Z]{3})\s*[-–]\s*(?:UPCOM|HNX)\)',     # (ABC - UPCOM), (ABC - HNX)
             r'\(([A-Z]{3})\s*,\s*(?:UPCOM|HNX)\)',        # (ABC, UPCOM), (ABC, HNX)
             r'\((?:UPCOM|HNX)\s*[-–]\s*([A-Z]{3})\)',     # (UPCOM - ABC), (HNX - ABC)
-        ]
-        
-        for pattern in patterns_with_exchange:
-            match = re.search(pattern, text_upper)
-            if match:
-                code = match.group(1)
-                if code in self.hnx_stocks:
-                    return code, 'HNX', 'code'
-                elif code in self.upcom_stocks:
-                    return code, 'UPCoM', 'code'
-        
-        # Pattern nhóm 2: Có từ khóa "mã"
-        patterns_with_ma = [
+            # Nhóm 2: Có từ khóa "mã"
             r'MÃ\s*(?:CK|CHỨNG KHOÁN|CP)?:?\s*([A-Z]{3})\b',    # Mã CK: ABC, Mã: ABC
             r'MÃ\s+([A-Z]{3})\b',                                # Mã ABC
             r'\(MÃ:?\s*([A-Z]{3})\)',                           # (Mã: ABC), (Mã ABC)
             r'\(MÃ\s*CK:?\s*([A-Z]{3})\)',                      # (Mã CK: ABC)
-        ]
-        
-        for pattern in patterns_with_ma:
-            match = re.search(pattern, text_upper)
-            if match:
-                code = match.group(1)
-                if code in self.hnx_stocks:
-                    return code, 'HNX', 'code'
-                elif code in self.upcom_stocks:
-                    return code, 'UPCoM', 'code'
-        
-        # Pattern nhóm 3: Có từ "cổ phiếu"
-        patterns_with_cp = [
+            # Nhóm 3: Có từ "cổ phiếu"
             r'CỔ\s+PHIẾU\s+([A-Z]{3})\b',                # Cổ phiếu ABC
             r'\(CỔ\s+PHIẾU:?\s*([A-Z]{3})\)',            # (Cổ phiếu: ABC)
+            # Nhóm 4: Đơn giản trong ngoặc
+            r'\(([A-Z]{3})\)',
         ]
+        self._signal_pattern_count = len(signal_patterns)
+        # Mọi pattern đều bắt đầu bằng "(", "MÃ" hoặc "CỔ": scanner chỉ dừng ở các vị trí đó,
+        # rồi thử phần còn lại của tất cả pattern bằng lookahead -> 1 lần quét cho ra
+        # match đầu tiên của từng pattern (giống re.search riêng cho từng pattern)
+        gates = [r'\(', 'MÃ', 'CỔ']
+        guarded = []
+        for pattern in signal_patterns:
+            gate = next(g for g in gates if pattern.startswith(g))
+            guarded.append(f'(?<={gate})(?={pattern[len(gate):]})')
+        # Chỉ dừng ở vị trí có ít nhất 1 pattern khớp (bản không capture của các lookahead)
+        any_hit = '(?=' + '|'.join(g.replace('([A-Z]{3})', '[A-Z]{3}') for g in guarded) + ')'
+        self._signal_scanner = re.compile(
+            '(?:' + '|'.join(gates) + ')' + any_hit + ''.join(f'(?:{g})?' for g in guarded)
+        )
         
-        for pattern in patterns_with_cp:
-            match = re.search(pattern, text_upper)
-            if match:
-                code = match.group(1)
+        # BƯỚC 2: mã đứng riêng + tín hiệu nhận diện / blacklist quanh mã
+        self._code_token_re = re.compile(r'\b([A-Z]{3})\b')
+        self._context_indicator_re = re.compile(
+            r'CÔNG\s+TY\s+'            # Công ty ABC
+            r'|MÃ\s+'                   # Mã ABC (không có dấu :)
+            r'|CỔ\s+PHIẾU\s+'           # Cổ phiếu ABC
+            r'|CP\s+'                   # CP ABC
+            r'|CK\s+'                   # CK ABC
+            r'|CTCP\s+'                 # CTCP ABC
+            r'|TNHH\s+'                 # TNHH ABC (ít gặp nhưng có thể có)
+            r'|TẬP\s+ĐOÀN\s+'           # Tập đoàn ABC
+            r'|NGÂN\s+HÀNG\s+'          # Ngân hàng ABC
+            r'|NH\s+'                   # NH ABC
+        )
+        self._blacklist_code_re = re.compile(r'(?:CHỨNG\s+KHOÁN|CTCK)\s+(?=([A-Z]{3}))')  # Chứng khoán ABC, CTCK ABC
+        self._blacklist_context_re = re.compile(r'VN-?INDEX|NHẬN\s+ĐỊNH')
+    
+    def extract_stock(self, text, article_text=None):
+        """Trích xuất mã CK - NÂNG CAO: YÊU CẦU TÍN HIỆU NHẬN DIỆN"""
+        text_upper = article_text.upper if article_text is not None else text.upper()
+        
+        # ============================================================
+        # BƯỚC 1: TÌM THEO CÁC PATTERN RÕ RÀNG (ƯU TIÊN CAO NHẤT)
+        # ============================================================
+        
+        # Match đầu tiên của từng pattern (giống re.search riêng cho từng pattern).
+        # Pattern ưu tiên cao hơn đã có match đầu tiên thì không thể đổi nữa,
+        # nên có thể dừng quét ngay khi đã quyết định được.
+        first_codes = [None] * self._signal_pattern_count
+        for match in self._signal_scanner.finditer(text_upper):
+            for k, code in enumerate(match.groups()):
+                if code is not None and first_codes[k] is None:
+                    first_codes[k] = code
+            for code in first_codes:
+                if code is None:
+                    break
                 if code in self.hnx_stocks:
                     return code, 'HNX', 'code'
                 elif code in self.upcom_stocks:
                     return code, 'UPCoM', 'code'
         
-        # Pattern nhóm 4: Đơn giản trong ngoặc
-        match = re.search(r'\(([A-Z]{3})\)', text_upper)
-        if match:
-            code = match.group(1)
+        for code in first_codes:
             if code in self.hnx_stocks:
                 return code, 'HNX', 'code'
             elif code in self.upcom_stocks:
@@ -526,63 +1951,24 @@ class StockScraperWeb:
         # BƯỚC 2: TÌM THEO MÃ CÓ TÍN HIỆU NHẬN DIỆN XUNG QUANH
         # ============================================================
         
-        # Định nghĩa các tín hiệu nhận diện (context indicators)
-        context_indicators = [
-            r'CÔNG\s+TY\s+',                    # Công ty ABC
-            r'MÃ\s+',                           # Mã ABC (không có dấu :)
-            r'CỔ\s+PHIẾU\s+',                   # Cổ phiếu ABC
-            r'CP\s+',                           # CP ABC
-            r'CK\s+',                           # CK ABC
-            r'CTCP\s+',                         # CTCP ABC
-            r'TNHH\s+',                         # TNHH ABC (ít gặp nhưng có thể có)
-            r'TẬP\s+ĐOÀN\s+',                   # Tập đoàn ABC
-            r'NGÂN\s+HÀNG\s+',                  # Ngân hàng ABC
-            r'NH\s+',                           # NH ABC
-        ]
-        
         # Tìm tất cả các cụm 3 ký tự hoa tách biệt
-        all_codes_in_text = re.finditer(r'\b([A-Z]{3})\b', text_upper)
-        
-        for match in all_codes_in_text:
+        for match in self._code_token_re.finditer(text_upper):
             code = match.group(1)
             
             # Kiểm tra xem mã có trong danh sách không
             if code not in self.hnx_stocks and code not in self.upcom_stocks:
                 continue
             
-            # Lấy context xung quanh (50 ký tự trước và sau)
+            # Kiểm tra blacklist trong context xung quanh (50 ký tự trước và sau)
             start = max(0, match.start() - 50)
             end = min(len(text_upper), match.end() + 50)
-            context = text_upper[start:end]
-            
-            # Kiểm tra blacklist patterns trong context
-            blacklist_in_context = [
-                r'CHỨNG\s+KHOÁN\s+' + code,     # Chứng khoán ABC (tên công ty CK)
-                r'CTCK\s+' + code,               # CTCK ABC
-                r'VN-?INDEX',                    # VN-INDEX
-                r'NHẬN\s+ĐỊNH',                  # ... có nhận định
-            ]
-            
-            is_blacklisted = False
-            for bl_pattern in blacklist_in_context:
-                if re.search(bl_pattern, context):
-                    is_blacklisted = True
-                    break
-            
-            if is_blacklisted:
+            if any(m.group(1) == code for m in self._blacklist_code_re.finditer(text_upper, start, end)):
+                continue
+            if self._blacklist_context_re.search(text_upper, start, end):
                 continue
             
-            # Kiểm tra xem có tín hiệu nhận diện không
-            has_indicator = False
-            for indicator in context_indicators:
-                # Tìm indicator TRƯỚC mã (trong vòng 30 ký tự)
-                before_context = text_upper[max(0, match.start() - 30):match.start()]
-                if re.search(indicator, before_context):
-                    has_indicator = True
-                    break
-            
-            # Nếu có tín hiệu nhận diện, return mã này
-            if has_indicator:
+            # Tìm tín hiệu nhận diện TRƯỚC mã (trong vòng 30 ký tự)
+            if self._context_indicator_re.search(text_upper, max(0, match.start() - 30), match.start()):
                 if code in self.hnx_stocks:
                     return code, 'HNX', 'code'
                 elif code in self.upcom_stocks:
@@ -592,7 +1978,7 @@ class StockScraperWeb:
         # BƯỚC 3: TÌM THEO TÊN CÔNG TY (ƯU TIÊN THẤP NHẤT)
         # ============================================================
         
-        words = text_lower.split()
+        words = article_text.words_lower if article_text is not None else text.lower().split()
         matched_codes = []
         for word in words:
             if len(word) > 3 and word in self.name_to_code:
@@ -606,17 +1992,154 @@ class StockScraperWeb:
         
         return None, None, None
     
-    def fetch_url(self, url, max_retries=2):
-        for attempt in range(max_retries):
+    def _now(self):
+        """Thời điểm hiện tại (giờ VN) - hoặc reference_time khi phát lại archive"""
+        return self.reference_time or datetime.now(self.vietnam_tz)
+    
+    def fetch_url(self, url, max_retries=2, max_age=None, watcher=None, max_bytes=None):
+        """Tải URL - qua archive nếu đang ghi / phát lại, xem _fetch_url_live"""
+        if self.archive is not None and self.archive.mode == 'replay':
+            response = self.archive.replay(url)
+            if response is None:
+                self.diagnostics.record_response('missing', origin='archive')
+                return None
+            self.diagnostics.record_response(response.status_code, len(response.content), origin='archive')
+            return response if response.ok else None
+        
+        response = self._fetch_url_live(url, max_retries, max_age, watcher, max_bytes)
+        if response is not None and self.archive is not None:
+            self.archive.record(url, response)
+        return response
+    
+    def _fetch_url_live(self, url, max_retries=2, max_age=None, watcher=None, max_bytes=None):
+        """Tải URL qua cache (nếu có)
+
+        max_age: số giây bản cache còn được dùng thẳng không cần hỏi server
+        (mặc định article_cache_ttl). Quá hạn thì gửi If-None-Match /
+        If-Modified-Since, server trả 304 thì dùng lại body trong cache.
+        watcher / max_bytes: tải body theo từng chunk, dừng khi watcher.done
+        hoặc đã đọc max_bytes byte (xem _read_streamed). Body bị cắt trong cache chỉ
+        dùng lại cho lần tải cũng theo chunk; lần tải cả trang thì bỏ qua bản đó.
+        """
+        if max_age is None:
+            max_age = self.article_cache_ttl
+        stream = watcher is not None or max_bytes is not None
+        
+        cached = self.http_cache.get(url) if self.http_cache else None
+        if cached and cached[0].get('truncated') and not stream:
+            cached = None
+        headers = self.headers
+        if cached:
+            meta, body = cached
+            if time.time() - meta['stored_at'] < max_age:
+                self.diagnostics.record_response(200, len(body), origin='cache')
+                return HttpDiskCache.to_response(meta, body)
+            
+            headers = dict(self.headers)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        # Lần đầu + tối đa max_retries lần thử lại (429/5xx, lỗi kết nối / timeout),
+        # lần nào cũng lấy token của rate limiter
+        for attempt in range(max_retries + 1):
             try:
-                response = self.session.get(url, headers=self.headers, timeout=15)
+                self.rate_limiter.acquire(url)
+                response = self.session.get(url, headers=headers, timeout=15, stream=stream)
+                if response.status_code == 304 and cached:
+                    response.close()
+                    self.diagnostics.record_response(304, origin='not_modified', retries=attempt)
+                    self.http_cache.touch(url, meta)
+                    return HttpDiskCache.to_response(meta, body)
+                if response.status_code in self.RETRY_STATUSES and attempt < max_retries:
+                    response.close()
+                    time.sleep(self._retry_delay(response, attempt))
+                    continue
+                if not response.ok:
+                    self.diagnostics.record_response(response.status_code, retries=attempt)
                 response.raise_for_status()
+                if stream:
+                    self._read_streamed(response, watcher, max_bytes)
+                self.diagnostics.record_response(response.status_code, len(response.content), retries=attempt)
+                # Body bị cắt vẫn đủ cho lần tải theo chunk sau - lưu kèm cờ truncated
+                if self.http_cache:
+                    self.http_cache.put(url, response)
                 return response
-            except:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt < max_retries:
+                    time.sleep(self._retry_delay(None, attempt))
+                    continue
+                self.diagnostics.record_response(type(e).__name__, retries=attempt)
+                return None
+            except Exception as e:
+                # Status lỗi (4xx/5xx) đã được ghi trước raise_for_status
+                if not isinstance(e, requests.HTTPError):
+                    self.diagnostics.record_response(type(e).__name__, retries=attempt)
                 return None
     
+    def _retry_delay(self, response, attempt):
+        """Số giây chờ trước lần thử lại: Retry-After của server (giây hoặc ngày giờ), không thì backoff"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0), self.MAX_RETRY_AFTER)
+        return self.RETRY_BACKOFF * 2 ** attempt
+    
+    def _read_streamed(self, response, watcher=None, max_bytes=None):
+        """Đọc body theo chunk vào response.content, dừng sớm nếu watcher.done / quá max_bytes
+
+        watcher chỉ đọc WATCHER_MAX_BYTES byte đầu: trang mà tới đó watcher chưa done thì
+        đọc tiếp không qua watcher (tránh parse cả trang 2 lần). response.truncated = True
+        nếu dừng trước khi hết body.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunks = []
+        size = 0
+        truncated = False
+        try:
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if watcher is not None:
+                    watcher.feed(decoder.decode(chunk))
+                    if watcher.done:
+                        truncated = True
+                        break
+                    if size >= self.WATCHER_MAX_BYTES:
+                        watcher = None
+                if max_bytes and size >= max_bytes:
+                    truncated = True
+                    break
+        finally:
+            # Đóng kết nối nếu dừng giữa chừng - phần còn lại không được tải về
+            response.close()
+        response._content = b''.join(chunks)
+        response._content_consumed = True
+        response.truncated = truncated
+    
+    def parse_time_of_day(self, date_text):
+        """(giờ, phút) trong chuỗi ngày tháng - (0, 0) nếu không có giờ"""
+        match = self.TIME_OF_DAY_RE.search(date_text)
+        if not match:
+            return 0, 0
+        hour, minute = int(match.group(1)), int(match.group(2))
+        meridiem = (match.group(3) or '').upper()
+        if meridiem == 'PM' and hour < 12:
+            hour += 12
+        elif meridiem == 'AM' and hour == 12:
+            hour = 0
+        if hour > 23 or minute > 59:
+            return 0, 0
+        return hour, minute
+    
     def parse_date(self, date_text):
         """Parse ngày tháng từ nhiều định dạng khác nhau"""
         if not date_text:
@@ -626,18 +2149,25 @@ class StockScraperWeb:
             # Loại bỏ khoảng trắng thừa
             date_text = date_text.strip()
             
-            # Định dạng ISO: 2025-10-21T14:30:00+07:00
-            if 'T' in date_text or '+' in date_text:
-                match = re.search(r'(\d{4})-(\d{2})-(\d{2})', date_text)
-                if match:
-                    year, month, day = match.groups()
-                    return datetime(int(year), int(month), int(day), tzinfo=self.vietnam_tz)
+            # Định dạng ISO: 2025-10-21T14:30:00+07:00 - giữ cả giờ và múi giờ
+            match = self.ISO_DATETIME_RE.search(date_text)
+            if match:
+                try:
+                    parsed = isoparse(match.group())
+                except ValueError:
+                    year, month, day = match.group(1, 2, 3)
+                    parsed = datetime(int(year), int(month), int(day))
+                # Không có múi giờ -> coi là giờ Việt Nam
+                if parsed.tzinfo is None:
+                    return parsed.replace(tzinfo=self.vietnam_tz)
+                return parsed.astimezone(self.vietnam_tz)
             
-            # Định dạng: 21/10/2025 14:30
+            # Định dạng: 21/10/2025 14:30, 21-10-2025 - 08:33 AM, 14h30 21/10/2025
             match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', date_text)
             if match:
                 day, month, year = match.groups()
-                return datetime(int(year), int(month), int(day), tzinfo=self.vietnam_tz)
+                hour, minute = self.parse_time_of_day(date_text)
+                return datetime(int(year), int(month), int(day), hour, minute, tzinfo=self.vietnam_tz)
             
             # Định dạng: 21-10-2025
             match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', date_text)
@@ -653,7 +2183,7 @@ class StockScraperWeb:
             
             # Từ khóa thời gian tương đối
             date_text_lower = date_text.lower()
-            now = datetime.now(self.vietnam_tz)
+            now = self._now()
             
             if 'hôm nay' in date_text_lower or 'today' in date_text_lower:
                 return now
@@ -672,54 +2202,119 @@ class StockScraperWeb:
         
         return None
     
+    def _json_ld_published(self, data):
+        """Tìm datePublished trong JSON-LD (object, list hoặc @graph)"""
+        if isinstance(data, list):
+            for item in data:
+                found = self._json_ld_published(item)
+                if found:
+                    return found
+        elif isinstance(data, dict):
+            if isinstance(data.get('datePublished'), str):
+                return data['datePublished']
+            for key in ('@graph', 'mainEntity', 'mainEntityOfPage'):
+                found = self._json_ld_published(data.get(key))
+                if found:
+                    return found
+        return None
+    
+    def extract_structured_date(self, soup):
+        """✅ Thời gian đăng đầy đủ (giờ + múi giờ) từ JSON-LD / meta trong <head>
+
+        Chỉ đọc vài thẻ trong <head> (cây rút gọn bằng strainer thì không có <head>
+        - khi đó cả cây chỉ gồm các thẻ cần thiết), không phải dò class trên toàn trang.
+        """
+        scope = soup.head or soup
+        for script in scope.find_all('script', type='application/ld+json'):
+            try:
+                data = json.loads(script.string or '')
+            except ValueError:
+                continue
+            date_obj = self.parse_date(self._json_ld_published(data))
+            if date_obj:
+                return date_obj
+        
+        for meta in scope.find_all('meta', content=True):
+            if any(meta.get(key) == value for key, value in STRUCTURED_DATE_META):
+                date_obj = self.parse_date(meta['content'])
+                if date_obj:
+                    return date_obj
+        return None
+    
     def fetch_article_content(self, url):
         """Lấy nội dung bài viết - từ V1.0"""
         try:
-            response = self.fetch_url(url)
+            template, strainer = self._templates.get(self._template_host(url), (None, ARTICLE_STRAINER))
+            # Có template thì biết chắc thẻ cần đọc -> dừng tải ngay khi đã qua ngày đăng + thân bài
+            watcher = None
+            if template:
+                watcher = ArticleEndWatcher(simple_selector_matcher(template['date']),
+                                            simple_selector_matcher(template['body']))
+            with self.diagnostics.stage('article_fetch'):
+                response = self.fetch_url(url, watcher=watcher, max_bytes=self.max_page_bytes)
             if not response:
                 return None, None, None
             
+            parse_start = time.perf_counter()
             response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # Chỉ dựng cây cho thẻ ngày đăng / khối nội dung / <p>, bỏ qua phần còn lại của trang
+            soup = make_soup(response.text, parse_only=strainer)
             
             # Tìm ngày - MỞ RỘNG CÁC SELECTOR
             date_text = None
-            article_date_obj = None
             
-            # Thử nhiều pattern khác nhau
-            for pattern in [
-                {'class': re.compile(r'date|time|publish|post.*date', re.I)},
-                {'itemprop': 'datePublished'},
-                {'property': 'article:published_time'},
-                {'name': 'pubdate'},
-                {'class': re.compile(r'meta.*time', re.I)}
-            ]:
-                date_elem = soup.find(['time', 'span', 'div', 'meta'], pattern)
+            # ✅ Nhanh nhất: JSON-LD / meta trong <head> (có cả giờ + múi giờ)
+            article_date_obj = self.extract_structured_date(soup)
+            
+            # ✅ Nguồn có template: tìm đúng thẻ ngày đăng
+            if template and not article_date_obj:
+                date_elem = find_first(soup, template['date'])
                 if date_elem:
                     date_text = date_elem.get('datetime') or date_elem.get('content') or date_elem.get_text(strip=True)
-                    if date_text:
-                        article_date_obj = self.parse_date(date_text)
-                        if article_date_obj:
-                            break
+                    article_date_obj = self.parse_date(date_text)
+            
+            # Thử nhiều pattern khác nhau
+            if not article_date_obj:
+                for pattern in [
+                    {'class': ARTICLE_DATE_CLASS_RE},
+                    {'itemprop': 'datePublished'},
+                    {'property': 'article:published_time'},
+                    {'name': 'pubdate'},
+                    {'class': re.compile(r'meta.*time', re.I)}
+                ]:
+                    date_elem = soup.find(['time', 'span', 'div', 'meta'], pattern)
+                    if date_elem:
+                        date_text = date_elem.get('datetime') or date_elem.get('content') or date_elem.get_text(strip=True)
+                        if date_text:
+                            article_date_obj = self.parse_date(date_text)
+                            if article_date_obj:
+                                break
             
             # Nếu không tìm thấy, dùng ngày hiện tại
             if not article_date_obj:
-                article_date_obj = datetime.now(self.vietnam_tz)
+                article_date_obj = self._now()
             
             article_date_str = article_date_obj.strftime('%d/%m/%Y %H:%M')
             
             # Tìm nội dung
             content = ""
-            for selector in [
-                ('article', {}),
-                ('div', {'class': re.compile(r'content|article|detail|body', re.I)}),
-            ]:
-                content_div = soup.find(selector[0], selector[1])
+            if template:
+                content_div = find_first(soup, template['body'])
                 if content_div:
                     paragraphs = content_div.find_all('p')
                     content = ' '.join([p.get_text(strip=True) for p in paragraphs if len(p.get_text(strip=True)) > 50])
-                    if content:
-                        break
+            
+            if not content:
+                for selector in [
+                    ('article', {}),
+                    ('div', {'class': ARTICLE_CONTENT_CLASS_RE}),
+                ]:
+                    content_div = soup.find(selector[0], selector[1])
+                    if content_div:
+                        paragraphs = content_div.find_all('p')
+                        content = ' '.join([p.get_text(strip=True) for p in paragraphs if len(p.get_text(strip=True)) > 50])
+                        if content:
+                            break
             
             if not content:
                 paragraphs = soup.find_all('p')
@@ -727,128 +2322,399 @@ class StockScraperWeb:
                 content = ' '.join(valid_p[:8])
             
             content = self.clean_text(content)
+            self.diagnostics.add_time('article_parse', time.perf_counter() - parse_start)
             return content, article_date_str, article_date_obj
         
         except:
             return None, None, None
+
+    def _template_host(self, url):
+        """Host (bỏ www.) - khoá tra SOURCE_TEMPLATES"""
+        host = urlparse(url).netloc.lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        return host
     
-    def scrape_source(self, url, source_name, pattern, max_articles=20, progress_callback=None):
+    def extract_listing_date(self, link_tag, max_levels=3):
+        """Đọc thời gian hiển thị cạnh link trên trang danh sách
+
+        Đi ngược lên tối đa max_levels thẻ cha, dừng khi khối cha đã chứa link
+        tới bài khác (tránh lấy nhầm thời gian của bài bên cạnh).
+        """
+        href = link_tag.get('href')
+        node = link_tag
+        for _ in range(max_levels):
+            node = node.parent
+            if node is None or node.name in ('body', 'html', '[document]'):
+                return None
+            if any(a.get('href') != href for a in node.find_all('a', href=True)):
+                return None
+            
+            date_tag = node.find(['span', 'time', 'div', 'p'], class_=self.LISTING_DATE_CLASSES) or node.find('time')
+            if date_tag:
+                date_text = date_tag.get('datetime') or date_tag.get('title') or date_tag.get_text(strip=True)
+                if any(label in date_text.lower() for label in self.RELATIVE_DAY_LABELS):
+                    return None
+                return self.parse_date(date_text)
+        return None
+    
+    @staticmethod
+    def is_date_only(date_obj):
+        """Thời gian chỉ có ngày (00:00), không biết giờ đăng"""
+        return date_obj.hour == date_obj.minute == date_obj.second == 0
+    
+    def is_listing_date_too_old(self, listing_date):
+        """True nếu thời gian trên trang danh sách chắc chắn nằm ngoài khoảng lọc"""
+        if listing_date is None:
+            return False
+        # Chỉ có ngày (00:00) -> so với cuối ngày để không loại nhầm bài trong ngày
+        if self.is_date_only(listing_date):
+            listing_date += timedelta(days=1)
+        return listing_date < self.cutoff_time
+    
+    @staticmethod
+    def listing_containers(link_tags):
+        """Khối danh sách của từng link + khối danh sách chính của trang
+
+        Khối của 1 link là thẻ cha gần nhất chứa thêm link ứng viên khác; khối chính là
+        khối của nhiều link nhất (các khối nổi bật / đọc nhiều thường ít link hơn).
+        Trả về (list id khối theo thứ tự link_tags, id khối chính).
+        """
+        chains = [list(tag.parents) for tag in link_tags]
+        counts = Counter(id(parent) for chain in chains for parent in chain)
+        containers = [
+            next((id(parent) for parent in chain if counts[id(parent)] > 1), None)
+            for chain in chains
+        ]
+        main = Counter(containers).most_common(1)[0][0] if containers else None
+        return containers, main
+    
+    def _host_semaphore(self, url):
+        """Semaphore giới hạn số request đồng thời tới cùng 1 host"""
+        host = urlparse(url).netloc.lower()
+        with self._host_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _fetch_article_limited(self, url, source_name=None):
+        """Chạy trong worker: tải 1 bài, tôn trọng giới hạn theo host"""
+        self.diagnostics.bind(source_name)
+        with self._host_semaphore(url):
+            return self.fetch_article_content(url)
+
+    def fetch_articles_concurrently(self, candidates, source_name=None):
+        """Tải song song danh sách (title, link) - yield kết quả theo thứ tự hoàn thành
+
+        Mỗi phần tử trả về: (idx, title, link, content, article_date_str, article_date_obj)
+        với idx là vị trí của link trên trang danh sách. Dừng vòng lặp (break/close)
+        sẽ huỷ các link chưa tải.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {
+                executor.submit(self._fetch_article_limited, link, source_name): (idx, title, link)
+                for idx, (title, link) in enumerate(candidates)
+            }
+            for future in as_completed(futures):
+                idx, title, link = futures[future]
+                content, article_date_str, article_date_obj = future.result()
+                yield idx, title, link, content, article_date_str, article_date_obj
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def scrape_source(self, url, source_name, pattern, max_articles=20, progress_callback=None, newest_first=False):
+        """Cào 1 nguồn - trả về số bài đưa vào kết quả (thời gian ghi vào diagnostics)"""
+        self.diagnostics.bind(source_name)
+        with self.diagnostics.stage('total'):
+            return self._scrape_source(url, source_name, pattern, max_articles, progress_callback, newest_first)
+    
+    def _scrape_source(self, url, source_name, pattern, max_articles=20, progress_callback=None, newest_first=False):
         try:
-            response = self.fetch_url(url)
+            with self.diagnostics.stage('listing_fetch'):
+                response = self.fetch_url(url, max_age=0)
             if not response:
                 return 0
             
+            parse_start = time.perf_counter()
             response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # Giữ cả cây (không strainer): extract_listing_date cần các thẻ cha quanh link
+            soup = make_soup(response.text)
             
             count = 0
             seen = set()
             links = soup.find_all('a', href=True)
-            total_links = len(links)
-            
-            # BƯỚC 1: CÀO TOÀN BỘ BÀI VIẾT TRƯỚC
-            all_crawled_articles = []
-            
-            for idx, link_tag in enumerate(links):
-                if progress_callback:
-                    progress = (idx + 1) / total_links * 0.5  # 50% cho việc cào
-                    progress_callback(f"{source_name} - Đang cào: {idx+1}/{total_links}", progress)
-                
+
+            # BƯỚC 1a: LỌC LINK ỨNG VIÊN TỪ TRANG DANH SÁCH
+            listed = []
+            for link_tag in links:
                 href = link_tag.get('href', '')
-                
+
                 if pattern(href) and href not in seen:
                     title = link_tag.get_text(strip=True)
-                    
+
                     # ✅ LỌC TIN CHUNG NGAY TẠI TIÊU ĐỀ
                     if title and len(title) > 30 and not self.is_generic_news(title):
                         seen.add(href)
-                        full_link = urljoin(url, href)
-                        
-                        # FETCH NỘI DUNG ĐẦY ĐỦ
-                        content, article_date_str, article_date_obj = self.fetch_article_content(full_link)
-                        
-                        # ✅ LỌC THỜI GIAN NGAY TẠI ĐÂY
-                        if content and article_date_obj:
-                            # Kiểm tra xem bài viết có nằm trong khoảng thời gian không
-                            if article_date_obj >= self.cutoff_time:
-                                all_crawled_articles.append({
-                                    'title': title,
-                                    'link': full_link,
-                                    'date': article_date_str,
-                                    'date_obj': article_date_obj,
-                                    'content': content
-                                })
-                            # else: bỏ qua bài viết quá cũ
-                            
-                            time.sleep(0.3)
-                            
-                            if len(all_crawled_articles) >= max_articles * 3:  # Cào nhiều hơn để lọc sau
-                                break
-            
-            self.stats['total_crawled'] = len(all_crawled_articles)
+                        listed.append((link_tag, title, href))
             
-            # BƯỚC 2: LỌC MÃ CK TỪ NỘI DUNG
-            for idx, article in enumerate(all_crawled_articles):
-                if progress_callback:
-                    progress = 0.5 + (idx + 1) / len(all_crawled_articles) * 0.5  # 50% còn lại cho việc lọc
-                    progress_callback(f"{source_name} - Đang lọc mã: {idx+1}/{len(all_crawled_articles)}", progress)
-                
-                # TRÍCH XUẤT MÃ CK TỪ NỘI DUNG (không phải tiêu đề)
-                full_text = article['title'] + " " + article['content']
-                stock_code, exchange, match_method = self.extract_stock(full_text)
+            # Dừng sớm chỉ theo danh sách chính - khối nổi bật / đọc nhiều có thể chứa bài cũ
+            if newest_first:
+                containers, main_container = self.listing_containers(tag for tag, _, _ in listed)
+            candidates = []
+            consecutive_old = 0
+            for position, (link_tag, title, href) in enumerate(listed):
+                # ✅ LỌC THỜI GIAN THEO TRANG DANH SÁCH - KHÔNG CẦN TẢI BÀI
+                listing_date = self.extract_listing_date(link_tag)
+                counts_for_stop = (newest_first and containers[position] == main_container
+                                   and listing_date is not None and not self.is_date_only(listing_date))
+                if self.is_listing_date_too_old(listing_date):
+                    with self._lock:
+                        self.stats['skipped_by_listing_date'] += 1
+                    if counts_for_stop:
+                        consecutive_old += 1
+                        # Danh sách mới nhất trước: 3 bài cũ liên tiếp -> phần còn lại đều cũ
+                        if consecutive_old >= 3:
+                            break
+                    continue
+                if counts_for_stop:
+                    consecutive_old = 0
                 
-                if stock_code and exchange in ['HNX', 'UPCoM']:
-                    if match_method == 'code':
-                        self.stats['found_by_code'] += 1
-                    else:
-                        self.stats['found_by_name'] += 1
-                    
-                    company_name = self.code_to_name.get(stock_code, '')
-                    
-                    # TÓM TẮT
-                    summary = self.advanced_summarize(article['content'], article['title'], max_sentences=4)
-                    
-                    # SENTIMENT
-                    sentiment_result = self.sentiment_analyzer.analyze_sentiment(article['title'], article['content'])
-                    
-                    if exchange == 'HNX':
-                        self.stats['hnx_found'] += 1
+                candidates.append((title, urljoin(url, href)))
+            self.diagnostics.add_time('listing_parse', time.perf_counter() - parse_start)
+
+            # BƯỚC 1b: LINK ĐÃ XỬ LÝ Ở LẦN CHẠY TRƯỚC (INCREMENTAL) - DÙNG LẠI KẾT QUẢ
+            # Chỉ dùng lại khi phân tích cùng danh sách mã + bộ từ khoá, không thì tải + phân tích lại.
+            # Bài cũ hơn mốc lọc bỏ qua luôn; link 'failed' chỉ tải lại sau SEEN_RETRY_SECONDS
+            crawled = []
+            known = self.seen_store.get_many(link for _, link in candidates) if self.seen_store else {}
+            analysis_key = self.analysis_key()
+            new_positions = []
+            for idx, (title, full_link) in enumerate(candidates):
+                stored = known.get(full_link)
+                if stored is None:
+                    new_positions.append(idx)
+                elif stored['status'] == 'failed':
+                    if time.time() - stored['processed_at'] >= self.SEEN_RETRY_SECONDS:
+                        new_positions.append(idx)
+                elif stored['date_obj'] < self.cutoff_time:
+                    continue
+                elif stored['status'] != 'analyzed' or stored['analysis_key'] != analysis_key:
+                    new_positions.append(idx)
+                else:
+                    crawled.append((idx, {
+                        'title': stored['title'],
+                        'link': full_link,
+                        'date': stored['date'],
+                        'date_obj': stored['date_obj'],
+                        'stored_result': stored['result']
+                    }))
+            
+            # BƯỚC 1c + 2: CÀO SONG SONG BÀI MỚI, LỌC MÃ CK NGAY KHI TẢI XONG
+            # Kết quả được đưa ra theo thứ tự trên trang danh sách: bài ở vị trí p chỉ ra khi mọi
+            # vị trí trước p đã xong (tải + lọc thời gian), nên kết quả cuối giống hệt cào xong mới lọc
+            resolved = {idx: None for idx in range(len(candidates))}
+            for idx in new_positions:
+                del resolved[idx]
+            for idx, article in crawled:
+                resolved[idx] = article
+            next_position = 0
+            
+            def analyze(article):
+                """Dòng kết quả của 1 bài (chỉ phân tích 1 lần)"""
+                if 'row' not in article:
+                    if 'stored_result' in article:
+                        article['row'] = article['stored_result']
                     else:
-                        self.stats['upcom_found'] += 1
-                    
-                    if sentiment_result['risk_level'] == 'Nghiêm trọng':
-                        self.stats['severe_risk'] += 1
-                    elif sentiment_result['risk_level'] == 'Cảnh báo':
-                        self.stats['warning_risk'] += 1
-                    
-                    self.all_articles.append({
-                        'Tiêu đề': article['title'],
-                        'Link': article['link'],
-                        'Ngày': article['date'],
-                        'Mã CK': stock_code,
-                        'Tên công ty': company_name,
-                        'Sàn': exchange,
-                        'Sentiment': sentiment_result['sentiment_label'],
-                        'Điểm': sentiment_result['sentiment_score'],
-                        'Risk': sentiment_result['risk_level'],
-                        'Vi phạm': sentiment_result['violations'],
-                        'Keywords': "; ".join([k['keyword'] for k in sentiment_result['keywords'][:3]]),
-                        'Nội dung tóm tắt': summary,
-                        'Tìm theo': 'Mã CK' if match_method == 'code' else 'Tên công ty'
-                    })
-                    
-                    count += 1
-                    
-                    if count >= max_articles:
-                        break
+                        with self.diagnostics.stage('analyze'):
+                            article['row'] = self.analyze_article(article)
+                        if self.seen_store:
+                            self.seen_store.save(article, article['row'], analysis_key)
+                        if self.article_store and article['row']:
+                            self.article_store.save(article, article['row'])
+                return article['row']
+            
+            def release():
+                """Đưa vào kết quả các bài liền nhau đã xong tính từ vị trí chưa đưa ra đầu tiên"""
+                nonlocal next_position, count
+                while count < max_articles and next_position in resolved:
+                    article = resolved.pop(next_position)
+                    next_position += 1
+                    if article is not None:
+                        row = analyze(article)
+                        if row:
+                            self._add_result(row)
+                            count += 1
+            
+            # Tiến độ tính trên mọi link của trang danh sách: link có sẵn trong seen store
+            # (dùng lại hoặc đã quá hạn) xong ngay, nên thanh tiến độ + bảng tạm không đứng ở 0
+            # khi gần như mọi bài đều đã xử lý ở lần chạy trước
+            reused = len(candidates) - len(new_positions)
+            
+            def report_progress(done):
+                if progress_callback and candidates:
+                    handled = reused + done
+                    note = f" (có sẵn {reused})" if reused else ""
+                    progress_callback(f"{source_name} - Đang cào: {handled}/{len(candidates)}{note} | {count} bài",
+                                      handled / len(candidates))
+            
+            with self._lock:
+                self.stats['total_crawled'] += len(crawled)
+            release()
+            report_progress(0)
+            new_candidates = [candidates[idx] for idx in new_positions]
+            if len(crawled) < max_articles * 3 and count < max_articles:
+                fetch_stream = self.fetch_articles_concurrently(new_candidates, source_name)
+                try:
+                    for done, (pos, title, full_link, content, article_date_str, article_date_obj) in enumerate(fetch_stream, 1):
+                        position = new_positions[pos]
+                        article = None
+                        
+                        # ✅ LỌC THỜI GIAN NGAY TẠI ĐÂY
+                        if content and article_date_obj and article_date_obj >= self.cutoff_time:
+                            article = {
+                                'title': title,
+                                'link': full_link,
+                                'date': article_date_str,
+                                'date_obj': article_date_obj,
+                                'content': content
+                            }
+                            crawled.append((position, article))
+                            with self._lock:
+                                self.stats['total_crawled'] += 1
+                            # Phân tích luôn, không chờ các bài đứng trước tải xong
+                            analyze(article)
+                        
+                        elif self.seen_store:
+                            # Ghi lại để lần poll sau không tải lại link này
+                            self.seen_store.save(
+                                {'link': full_link, 'title': title, 'date': article_date_str, 'date_obj': article_date_obj},
+                                None,
+                                status='too_old' if article_date_obj and article_date_obj < self.cutoff_time else 'failed'
+                            )
+                        
+                        resolved[position] = article
+                        release()
+                        
+                        report_progress(done)
+                        
+                        # Đủ bài thì dừng, các link còn lại không cần tải
+                        if count >= max_articles or len(crawled) >= max_articles * 3:  # Cào nhiều hơn để lọc sau
+                            break
+                finally:
+                    fetch_stream.close()
+            
+            # Link chưa tải (đã dừng sớm) coi như bị loại - đưa ra phần còn lại theo thứ tự
+            for idx in range(next_position, len(candidates)):
+                resolved.setdefault(idx, None)
+            release()
             
             return count
         
         except Exception as e:
-            st.error(f"Lỗi {source_name}: {str(e)}")
+            # Không gọi st.error ở đây vì có thể đang chạy trong worker thread
+            with self._lock:
+                self.errors.append((source_name, str(e)))
             return 0
     
-    def run(self, max_articles_per_source=20, progress_callback=None):
+    def analysis_key(self):
+        """Khoá của cách phân tích hiện tại: danh sách mã + version bộ từ khoá"""
+        return f"{self.stock_key}:{self.sentiment_analyzer.lexicon_version()}"
+    
+    def analyze_article(self, article):
+        """Trích mã CK + tóm tắt + sentiment cho 1 bài - trả về dòng kết quả hoặc None"""
+        # Chuẩn hoá text 1 lần, dùng chung cho tìm mã / tóm tắt / sentiment
+        article_text = ArticleText(article['title'], article['content'])
+        
+        # TRÍCH XUẤT MÃ CK TỪ NỘI DUNG (không phải tiêu đề)
+        stock_code, exchange, match_method = self.extract_stock(article_text.raw, article_text=article_text)
+        
+        if not stock_code or exchange not in ['HNX', 'UPCoM']:
+            return None
+        
+        company_name = self.code_to_name.get(stock_code, '')
+        
+        # TÓM TẮT
+        summary = self.advanced_summarize(article['content'], article['title'], max_sentences=4,
+                                          article_text=article_text)
+        
+        # SENTIMENT
+        sentiment_result = self.sentiment_analyzer.analyze_sentiment(article['title'], article['content'],
+                                                                     article_text=article_text)
+        
+        return {
+            'Tiêu đề': article['title'],
+            'Link': article['link'],
+            'Ngày': article['date'],
+            'Mã CK': stock_code,
+            'Tên công ty': company_name,
+            'Sàn': exchange,
+            'Sentiment': sentiment_result['sentiment_label'],
+            'Điểm': sentiment_result['sentiment_score'],
+            'Risk': sentiment_result['risk_level'],
+            'Vi phạm': sentiment_result['violations'],
+            'Keywords': "; ".join([k['keyword'] for k in sentiment_result['keywords'][:3]]),
+            'Nội dung tóm tắt': summary,
+            'Tìm theo': 'Mã CK' if match_method == 'code' else 'Tên công ty'
+        }
+    
+    def _add_result(self, row):
+        """Cập nhật stats + kết quả chung - có thể chạy song song nhiều nguồn"""
+        with self._lock:
+            if row['Tìm theo'] == 'Mã CK':
+                self.stats['found_by_code'] += 1
+            else:
+                self.stats['found_by_name'] += 1
+            
+            if row['Sàn'] == 'HNX':
+                self.stats['hnx_found'] += 1
+            else:
+                self.stats['upcom_found'] += 1
+            
+            if row['Risk'] == 'Nghiêm trọng':
+                self.stats['severe_risk'] += 1
+            elif row['Risk'] == 'Cảnh báo':
+                self.stats['warning_risk'] += 1
+            
+            self.all_articles.append(row)
+            self.diagnostics.result_added()
+    
+    def _scrape_sources_parallel(self, sources, max_articles_per_source, progress_callback=None):
+        """Cào tất cả nguồn cùng lúc, mỗi nguồn 1 thread
+
+        Worker không được gọi Streamlit trực tiếp, nên tiến độ được đẩy vào queue
+        và thread chính chuyển tiếp sang progress_callback(message, progress, source=...).
+        """
+        events = queue.Queue()
+        
+        def make_callback(source_name):
+            def callback(message, progress):
+                events.put((source_name, message, progress))
+            return callback
+        
+        def drain_events():
+            while True:
+                try:
+                    source_name, message, progress = events.get_nowait()
+                except queue.Empty:
+                    return
+                if progress_callback:
+                    progress_callback(message, progress, source=source_name)
+        
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            pending = {
+                executor.submit(self.scrape_source, url, name, pattern, max_articles_per_source,
+                                make_callback(name), name in self.NEWEST_FIRST_SOURCES)
+                for url, name, pattern in sources
+            }
+            while pending:
+                _, pending = wait(pending, timeout=0.2)
+                drain_events()
+        drain_events()
+    
+    def run(self, max_articles_per_source=20, progress_callback=None, parallel_sources=False):
         sources = [
             ("https://cafef.vn/thi-truong-chung-khoan.chn", "CafeF", lambda h: '.chn' in h),
             ("https://vietstock.vn/chung-khoan.htm", "VietStock", lambda h: re.search(r'/\d{4}/\d{2}/.+\.htm', h)),
@@ -858,9 +2724,22 @@ class StockScraperWeb:
             ("https://www.tinnhanhchungkhoan.vn/doanh-nghiep/", "Tin Nhanh CK (DN)", lambda h: '/doanh-nghiep/' in h or '/chung-khoan/' in h),
         ]
         
-        for url, name, pattern in sources:
-            self.scrape_source(url, name, pattern, max_articles_per_source, progress_callback)
-            time.sleep(1)
+        if self.requests_per_second is not None:
+            for url, _, _ in sources:
+                self.rate_limiter.set_rate(url, self.requests_per_second)
+        
+        self.diagnostics.started = time.perf_counter()
+        if parallel_sources:
+            self._scrape_sources_parallel(sources, max_articles_per_source, progress_callback)
+        else:
+            for url, name, pattern in sources:
+                self.scrape_source(url, name, pattern, max_articles_per_source, progress_callback,
+                                   newest_first=name in self.NEWEST_FIRST_SOURCES)
+        
+        # Lỗi từng nguồn nằm trong self.errors - main() hiển thị (run() có thể chạy trong thread nền)
+        self.stats['diagnostics'] = self.diagnostics.summary()
+        if self.http_cache is not None:
+            self.http_cache.prune()
         
         if len(self.all_articles) == 0:
             return None
@@ -869,8 +2748,136 @@ class StockScraperWeb:
         df = df.drop_duplicates(subset=['Tiêu đề'], keep='first')
         df.insert(0, 'STT', range(1, len(df) + 1))
         
+        if self.result_dataset is not None:
+            try:
+                self.result_dataset.append(df, run_at=datetime.now(self.vietnam_tz))
+            except Exception as e:
+                self.errors.append(('Parquet', str(e)))
+        
         return df
 
+# ============================================================
+# CRAWL JOBS (CHẠY NỀN)
+# ============================================================
+
+class CrawlJob:
+    """1 lần cào chạy nền trong thread riêng - không bị huỷ / chặn khi Streamlit rerun
+
+    Thread nền không gọi st.*: tiến độ, lỗi và kết quả được giữ lại để UI đọc ở mỗi lần rerun.
+    """
+    def __init__(self, job_id, key, scraper, run_kwargs):
+        self.id = job_id
+        self.key = key
+        self.scraper = scraper
+        self.run_kwargs = run_kwargs
+        self.status = 'running'
+        self.result = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        # Số phiên đang theo dõi job (xem CrawlJobManager.release)
+        self.watchers = 1
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._thread = threading.Thread(target=self._run, name=f"crawl-{job_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _on_progress(self, message, progress, source=None):
+        with self._lock:
+            self._progress[source] = (message, min(progress, 1.0))
+
+    def _run(self):
+        try:
+            self.result = self.scraper.run(progress_callback=self._on_progress, **self.run_kwargs)
+            self.status = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'error'
+        finally:
+            self.finished_at = time.time()
+
+    @property
+    def running(self):
+        return self.status == 'running'
+
+    def progress(self):
+        """Bản chụp tiến độ {nguồn: (message, progress)} - nguồn None là tiến độ chung (cào lần lượt)"""
+        with self._lock:
+            return dict(self._progress)
+
+    def partial_results(self):
+        """Các dòng kết quả đã có tới thời điểm này (bỏ trùng tiêu đề như run())"""
+        with self.scraper._lock:
+            rows = list(self.scraper.all_articles)
+        df = pd.DataFrame(rows)
+        if len(df):
+            df = df.drop_duplicates(subset=['Tiêu đề'], keep='first')
+        return df
+    
+    def stats(self):
+        """Bản chụp stats của scraper tại thời điểm này"""
+        with self.scraper._lock:
+            return dict(self.scraper.stats)
+
+
+class CrawlJobManager:
+    """Các CrawlJob của cả process - dùng chung giữa mọi phiên / người dùng qua get_job_manager()
+
+    Bấm cào với đúng tham số của 1 job đang chạy thì dùng chung job đó thay vì cào lại.
+    Job đã xong được giữ tới khi mọi phiên theo dõi đã đọc kết quả (release); phiên bị
+    đóng giữa chừng không release được nên vẫn giữ tối đa max_finished job đã xong.
+    """
+    def __init__(self, max_finished=20):
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(stock_key, params):
+        """Khoá của 1 lần cào: khoá danh sách mã (hash file upload) + tham số"""
+        digest = hashlib.sha1(stock_key.encode('utf-8'))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def submit(self, key, make_scraper, run_kwargs):
+        """Trả về (job, created) - created=False nếu đang có job cùng key"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == key and job.running:
+                    job.watchers += 1
+                    return job, False
+            self._evict_finished()
+            job = CrawlJob(uuid.uuid4().hex[:12], key, make_scraper(), run_kwargs)
+            self._jobs[job.id] = job
+        job.start()
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def release(self, job_id):
+        """1 phiên thôi theo dõi job - job đã xong và không còn ai theo dõi thì bỏ khỏi bộ nhớ"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.watchers -= 1
+            if job.watchers <= 0 and not job.running:
+                del self._jobs[job_id]
+
+    def _evict_finished(self):
+        finished = sorted((job for job in self._jobs.values() if not job.running), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_finished + 1)]:
+            del self._jobs[job.id]
+
+@st.cache_resource(show_spinner=False)
+def get_job_manager():
+    return CrawlJobManager()
+
 # ============================================================
 # STREAMLIT APP
 # ============================================================
@@ -909,9 +2916,11 @@ def main():
             if error:
                 st.error(f"❌ {error}")
                 st.session_state['stock_df'] = load_default_stock_list()
+                st.session_state['stock_key'] = 'default'
             else:
                 st.success(f"✅ Đã load {len(stock_df)} mã CK")
                 st.session_state['stock_df'] = stock_df
+                st.session_state['stock_key'] = stock_file_key(uploaded_file)
                 
                 hnx_count = len(stock_df[stock_df['Sàn'] == 'HNX'])
                 upcom_count = len(stock_df[stock_df['Sàn'] == 'UPCoM'])
@@ -919,6 +2928,7 @@ def main():
         else:
             if 'stock_df' not in st.session_state:
                 st.session_state['stock_df'] = load_default_stock_list()
+                st.session_state['stock_key'] = 'default'
                 st.warning("⚠️ Đang dùng danh sách mặc định")
         
         st.markdown("---")
@@ -939,39 +2949,163 @@ def main():
             step=5
         )
         
+        requests_per_second = st.slider(
+            "🐢 Số request/giây mỗi site",
+            min_value=0.5,
+            max_value=5.0,
+            value=2.0,
+            step=0.5,
+            help="Giới hạn tốc độ gửi request tới từng site để không bị chặn"
+        )
+        
+        use_cache = st.checkbox(
+            "💾 Cache trang đã tải",
+            value=True,
+            help="Bài viết đã tải được lấy lại từ đĩa; trang danh sách chỉ tải lại khi có thay đổi. Trang lưu quá 14 ngày hoặc vượt 200 MB được tự xoá"
+        )
+        
+        incremental = st.checkbox(
+            "🔁 Chỉ xử lý bài mới (incremental)",
+            value=False,
+            help="Link đã xử lý ở lần chạy trước được dùng lại kết quả cũ, không tải lại (kể cả bài cũ hơn mốc lọc; link tải lỗi thử lại sau 1 giờ)"
+        )
+        
+        save_to_store = st.checkbox(
+            "🗄️ Lưu vào kho bài viết",
+            value=True,
+            help="Lưu kết quả + nội dung bài vào .scraper_cache/articles.db để tra cứu lại không cần cào"
+        )
+        
+        save_parquet = st.checkbox(
+            "📦 Lưu Parquet (phân tích)",
+            value=True,
+            help="Ghi thêm kết quả mỗi lần chạy vào .scraper_cache/results (phân vùng theo ngày đăng + Sàn, đọc được bằng pandas / DuckDB). "
+                 "Chỉ ghi thêm: điểm giữ nguyên như lúc chạy, 'Chấm điểm lại kho' không sửa dataset"
+        )
+        
+        parallel_sources = st.checkbox(
+            "⚡ Cào song song các nguồn",
+            value=True,
+            help="Cào CafeF, VietStock, Người Quan Sát, Báo Mới, Tin Nhanh CK cùng lúc"
+        )
+        
+        archive_options = {"Tắt": None, "Ghi lại (record)": 'record', "Phát lại (replay)": 'replay'}
+        archive_choice = st.selectbox(
+            "📼 Ghi / phát lại dữ liệu",
+            list(archive_options),
+            help="Ghi lại mọi trang đã tải vào .scraper_cache/archive.db, hoặc chạy lại trên dữ liệu đã ghi (không ra mạng)"
+        )
+        archive_mode = archive_options[archive_choice]
+        
         st.markdown("---")
         st.info("💡 **Hướng dẫn:**\n1. Upload danh sách mã\n2. Chọn thời gian\n3. Bấm 'Bắt đầu'\n4. Download Excel")
     
     # Main content
     if st.button("🚀 BẮT ĐẦU CÀO TIN", type="primary"):
         stock_df = st.session_state.get('stock_df')
+        stock_key = st.session_state.get('stock_key', 'default')
         
         if stock_df is None or len(stock_df) == 0:
             st.error("❌ Chưa có danh sách mã CK! Vui lòng upload file.")
             return
         
-        with st.spinner("Đang cào tin..."):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            def update_progress(message, progress):
-                status_text.text(message)
-                progress_bar.progress(progress)
-            
-            scraper = StockScraperWeb(stock_df, time_filter_hours=time_filter)
-            df = scraper.run(max_articles_per_source=max_articles, progress_callback=update_progress)
-            
-            progress_bar.empty()
-            status_text.empty()
+        params = {
+            'time_filter': time_filter,
+            'max_articles': max_articles,
+            'requests_per_second': requests_per_second,
+            'use_cache': use_cache,
+            'incremental': incremental,
+            'parallel_sources': parallel_sources,
+            'archive_mode': archive_mode,
+            'save_to_store': save_to_store,
+            'save_parquet': save_parquet,
+        }
+        
+        def make_scraper():
+            return StockScraperWeb(
+                stock_df,
+                time_filter_hours=time_filter,
+                rate_limiter=get_rate_limiter(),
+                requests_per_second=requests_per_second,
+                http_cache=HttpDiskCache() if use_cache else None,
+                seen_store=SeenArticleStore() if incremental else None,
+                session=get_http_session(),
+                archive=ResponseArchive(mode=archive_mode) if archive_mode else None,
+                article_store=get_article_store() if save_to_store else None,
+                result_dataset=get_result_dataset() if save_parquet else None,
+                universe=get_stock_universe(stock_key, stock_df)
+            )
+        
+        # ✅ Cào trong thread nền: tương tác với widget (rerun) không làm dừng lần cào
+        job, created = get_job_manager().submit(
+            CrawlJobManager.make_key(stock_key, params),
+            make_scraper,
+            {'max_articles_per_source': max_articles, 'parallel_sources': parallel_sources}
+        )
+        previous_job_id = st.session_state.get('job_id')
+        if previous_job_id and previous_job_id != job.id:
+            get_job_manager().release(previous_job_id)
+        st.session_state['job_id'] = job.id
+        st.session_state['job_shared'] = not created
+    
+    # Theo dõi job đang chạy (job_id giữ qua các lần rerun)
+    job_id = st.session_state.get('job_id')
+    job = get_job_manager().get(job_id) if job_id else None
+    poll_job = False
+    if job_id and job is None:
+        # Server đã khởi động lại - job cũ không còn
+        del st.session_state['job_id']
+        st.session_state.pop('job_shared', None)
+    elif job is not None and job.running:
+        st.info(f"⏳ Đang cào tin... ({time.time() - job.started_at:.0f}s)")
+        if st.session_state.get('job_shared'):
+            st.caption("🔗 Đang có lần cào với cùng cài đặt - dùng chung kết quả, không cào lại")
+        for source, (message, value) in sorted(job.progress().items(), key=lambda item: item[0] or ''):
+            st.progress(value, text=message if source is None else f"{source}: {message}")
+        
+        # ✅ Kết quả + chỉ số cập nhật ngay khi từng bài được phân tích xong
+        partial = job.partial_results()
+        live_stats = job.stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("📊 Đã tìm thấy", len(partial))
+        with col2:
+            st.metric("⚠️ Nghiêm trọng", live_stats['severe_risk'])
+        with col3:
+            st.metric("⚠️ Cảnh báo", live_stats['warning_risk'])
+        with col4:
+            st.metric("🌐 Bài trong khoảng thời gian", live_stats['total_crawled'])
+        if len(partial):
+            st.dataframe(partial[['Mã CK', 'Sàn', 'Risk', 'Sentiment', 'Ngày', 'Tiêu đề']],
+                         use_container_width=True, hide_index=True)
+        
+        # Làm mới ở cuối trang - kết quả lần trước + tra cứu kho vẫn hiển thị khi đang cào
+        poll_job = True
+        if 'df' in st.session_state:
+            st.markdown("---")
+            st.caption("📁 Kết quả lần cào trước")
+    elif job is not None:
+        del st.session_state['job_id']
+        st.session_state.pop('job_shared', None)
+        # Đã đọc kết quả - bỏ job (scraper + kết quả) khỏi bộ nhớ nếu không còn phiên khác theo dõi
+        get_job_manager().release(job.id)
+        scraper = job.scraper
+        
+        for source_name, message in scraper.errors:
+            st.error(f"Lỗi {source_name}: {message}")
+        
+        df = job.result
+        if job.status == 'error':
+            st.error(f"Lỗi khi cào: {job.error}")
+        elif df is not None:
+            st.success(f"✅ Hoàn tất! Tìm thấy {len(df)} bài viết")
+            st.info(f"🔍 Tìm theo mã CK: {scraper.stats['found_by_code']} | Tìm theo tên: {scraper.stats['found_by_name']}")
             
-            if df is not None:
-                st.success(f"✅ Hoàn tất! Tìm thấy {len(df)} bài viết")
-                st.info(f"🔍 Tìm theo mã CK: {scraper.stats['found_by_code']} | Tìm theo tên: {scraper.stats['found_by_name']}")
-                
-                st.session_state['df'] = df
-                st.session_state['stats'] = scraper.stats
-            else:
-                st.error("Không tìm thấy bài viết nào!")
+            st.session_state['df'] = df
+            st.session_state['df_key'] = result_key(df)
+            st.session_state['stats'] = scraper.stats
+        else:
+            st.error("Không tìm thấy bài viết nào!")
     
     # Display results
     if 'df' in st.session_state:
@@ -991,25 +3125,44 @@ def main():
         with col5:
             st.metric("📝 Tìm theo tên", stats['found_by_name'])
         
-        # Download button
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Tất cả')
-            
-            df_severe = df[df['Risk'] == 'Nghiêm trọng']
-            if len(df_severe) > 0:
-                df_severe.to_excel(writer, index=False, sheet_name='Nghiêm trọng')
-            
-            df_warning = df[df['Risk'] == 'Cảnh báo']
-            if len(df_warning) > 0:
-                df_warning.to_excel(writer, index=False, sheet_name='Cảnh báo')
-        
-        st.download_button(
-            label="⬇️ Download Excel",
-            data=buffer.getvalue(),
-            file_name=f"Tin_CK_{datetime.now().strftime('%d%m%Y_%H%M')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        # Diagnostics: thời gian chậm do mạng, do 1 host hay do CPU trích xuất
+        diagnostics = stats.get('diagnostics')
+        if diagnostics:
+            with st.expander("🩺 Diagnostics"):
+                diag_df = RunDiagnostics.table(diagnostics)
+                if len(diag_df):
+                    network_s = diag_df[['Tải danh sách (s)', 'Tải bài (s)']].sum().sum()
+                    cpu_s = diag_df[['Parse danh sách (s)', 'Parse bài (s)', 'Phân tích (s)']].sum().sum()
+                    slowest = diag_df.iloc[0]
+                    first_result = diagnostics.get('first_result_s')
+                    st.caption(
+                        (f"⚡ Bài đầu tiên sau {first_result:.1f}s | " if first_result is not None else "") +
+                        f"⏱️ Tổng {diagnostics['wall_s']:.1f}s | Mạng {network_s:.1f}s, CPU {cpu_s:.1f}s "
+                        f"(cộng dồn các worker) | Chậm nhất: {slowest['Nguồn']} ({slowest['Thời gian (s)']:.1f}s)"
+                    )
+                    st.dataframe(diag_df, use_container_width=True, hide_index=True)
+        
+        # Download: file chỉ được tạo khi bấm, cache theo bộ kết quả (không ghi lại ở mỗi lần rerun)
+        df_key = st.session_state.get('df_key') or result_key(df)
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            export_format = st.selectbox(
+                "📁 Định dạng tải về",
+                list(EXPORT_FORMATS),
+                format_func=lambda fmt: EXPORT_FORMATS[fmt][0],
+                key="export_format"
+            )
+        requested = st.session_state.setdefault('export_requested', set())
+        with col2:
+            if (df_key, export_format) not in requested and st.button("📦 Tạo file tải về"):
+                requested.add((df_key, export_format))
+            if (df_key, export_format) in requested:
+                st.download_button(
+                    label=f"⬇️ Download {EXPORT_FORMATS[export_format][0]}",
+                    data=build_export(df_key, export_format, df),
+                    file_name=f"Tin_CK_{datetime.now().strftime('%d%m%Y_%H%M')}.{export_format}",
+                    mime=EXPORT_FORMATS[export_format][1]
+                )
         
         st.markdown("---")
         
@@ -1158,6 +3311,58 @@ def main():
                 use_container_width=True,
                 hide_index=True
             )
+    
+    # Tra cứu lịch sử trong kho bài viết - chạy tại máy, không ra mạng
+    st.markdown("---")
+    st.subheader("🗄️ TRA CỨU KHO BÀI VIẾT")
+    
+    store = get_article_store()
+    col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
+    with col1:
+        store_text = st.text_input("Từ khoá (tiêu đề + nội dung)", placeholder="VD: khởi tố, phát hành", key="store_text")
+    with col2:
+        store_code = st.text_input("Mã CK", placeholder="VD: CEO", key="store_code")
+    with col3:
+        store_san = st.selectbox("Sàn", ["Tất cả", "HNX", "UPCoM"], key="store_san")
+    with col4:
+        store_risk = st.selectbox("Risk", ["Tất cả", "Nghiêm trọng", "Cảnh báo", "Bình thường", "Tích cực"], key="store_risk")
+    with col5:
+        store_days = st.selectbox(
+            "Thời gian", [7, 30, 90, 365, None],
+            format_func=lambda x: f"{x} ngày" if x else "Tất cả",
+            index=2,
+            key="store_days"
+        )
+    
+    if st.button("🔁 Chấm điểm lại kho", key="store_rescore",
+                 help="Tính lại Sentiment / Risk / Vi phạm cho mọi bài trong kho theo bộ từ khoá hiện tại "
+                      "(chỉ kho bài viết - dataset Parquet giữ điểm của từng lần chạy)"):
+        start = time.perf_counter()
+        with st.spinner("Đang chấm điểm lại..."):
+            rescored = store.rescore(SimpleSentimentAnalyzer())
+        st.success(f"✅ Đã chấm lại {rescored} bài trong {time.perf_counter() - start:.1f}s")
+    
+    start = time.perf_counter()
+    found = store.search(
+        text=store_text,
+        code=store_code.strip(),
+        exchange=None if store_san == "Tất cả" else store_san,
+        risk=None if store_risk == "Tất cả" else store_risk,
+        since=datetime.now(ArticleStore.VIETNAM_TZ) - timedelta(days=store_days) if store_days else None,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    st.caption(f"{len(found)} bài (tối đa 500) / {store.count()} bài trong kho | {elapsed_ms:.0f} ms"
+               + ("" if store.fts else " | SQLite không hỗ trợ FTS5 - đang tìm bằng LIKE"))
+    if len(found):
+        st.dataframe(
+            found[['Ngày', 'Mã CK', 'Sàn', 'Risk', 'Sentiment', 'Tiêu đề', 'Vi phạm', 'Link']],
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    if poll_job:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -14,8 +14,9 @@ import pandas as pd
 from datetime import datetime, timedelta, timezone
 import time
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import io
+import threading
 
 # ============================================================
 # CONFIG
@@ -290,18 +291,66 @@ class SimpleSentimentAnalyzer:
             "violations": keyword_analysis["violations"]
         }
 
+# ============================================================
+# RATE LIMITER
+# ============================================================
+
+class DomainRateLimiter:
+    """Giới hạn tốc độ request theo từng domain (token bucket)
+
+    Mỗi domain có 1 "xô" chứa tối đa `burst` token, được nạp lại với tốc độ
+    `requests_per_second`. Mỗi request lấy 1 token, hết token thì chờ.
+    Dùng chung 1 instance cho mọi thread để vẫn lịch sự khi cào song song.
+    """
+    def __init__(self, requests_per_second=2.0, burst=4, per_domain=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        # Cấu hình riêng cho từng site: {'cafef.vn': (requests_per_second, burst)}
+        self.per_domain = per_domain or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        return domain[4:] if domain.startswith('www.') else domain
+    
+    def acquire(self, url):
+        """Chờ tới khi domain của url còn token rồi lấy 1 token"""
+        domain = self._domain(url)
+        rate, burst = self.per_domain.get(domain, (self.requests_per_second, self.burst))
+        if rate <= 0:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(domain, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[domain] = (tokens - 1, now)
+                    return
+                self._buckets[domain] = (tokens, now)
+                wait_time = (1 - tokens) / rate
+            time.sleep(wait_time)
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    """Rate limiter dùng chung cho cả process - mọi lần chạy / người dùng chung xô token mỗi site"""
+    return DomainRateLimiter()
+
 # ============================================================
 # STOCK SCRAPER
 # ============================================================
 
 class StockScraperWeb:
-    def __init__(self, stock_df, time_filter_hours=24):
+    def __init__(self, stock_df, time_filter_hours=24, rate_limiter=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept-Language': 'vi-VN,vi;q=0.9,en;q=0.8',
         }
         self.all_articles = []
         self.session = requests.Session()
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
         self.time_filter_hours = time_filter_hours
         
         self.vietnam_tz = timezone(timedelta(hours=7))
@@ -335,6 +384,14 @@ class StockScraperWeb:
         for code in self.hose_stocks:
             self.stock_to_exchange[code] = 'HOSE'
         
+        # Quét mã trong bài: tách token 1 lần rồi tra tập mã (không chạy 1 regex cho mỗi mã)
+        self.all_codes = self.hnx_stocks | self.upcom_stocks | self.hose_stocks
+        self._code_token_re = re.compile(r'\b[A-Z0-9]+\b')
+        # Mã có ký tự ngoài A-Z/0-9 (hiếm) vẫn tìm bằng regex riêng
+        self._irregular_codes = [code for code in self.all_codes if not re.fullmatch(r'[A-Z0-9]+', code)]
+        self._ctck_re = re.compile(r'CHỨNG KHOÁN\s+')
+        self._signal_re_cache = {}
+        
         self.stats = {
             'total_crawled': 0,
             'hnx_found': 0,
@@ -485,6 +542,27 @@ class StockScraperWeb:
         
         return False
     
+    def has_clear_signal(self, code, context):
+        """Kiểm tra xem có tín hiệu nhận diện rõ ràng không"""
+        signal_re = self._signal_re_cache.get(code)
+        if signal_re is None:
+            code_re = re.escape(code)
+            signal_patterns = [
+                r'CÔNG\s+TY\s+' + code_re,
+                r'MÃ\s+(?:CK|CHỨNG KHOÁN|CỔ PHIẾU)?\s*:\s*' + code_re,
+                r'CỔ\s+PHIẾU\s+' + code_re,
+                r'\(' + code_re + r'\s*[-–,]\s*(?:HNX|UPCOM|HOSE)\)',
+                r'\((?:HNX|UPCOM|HOSE)\s*[-–,:]\s*' + code_re + r'\)',
+                r'\(\s*' + code_re + r'\s*\)',  # (CEO)
+                r'\(\s*MÃ\s*:\s*' + code_re + r'\s*\)',  # (mã: CEO)
+                r'\(\s*MÃ\s+CỔ\s+PHIẾU\s*:\s*' + code_re + r'\s*\)',  # (mã cổ phiếu: CEO)
+                r'\b' + code_re + r'\s*[-–]\s*(?:HNX|UPCOM|HOSE)',  # CEO - HNX
+            ]
+            # Gộp thành 1 regex, biên dịch 1 lần cho mỗi mã thực sự xuất hiện
+            signal_re = re.compile('|'.join(signal_patterns))
+            self._signal_re_cache[code] = signal_re
+        return signal_re.search(context.upper()) is not None
+    
     def extract_stock(self, text):
         """
         Trích xuất mã CK - QUÉT TOÀN BỘ BÀI
@@ -515,63 +593,41 @@ class StockScraperWeb:
         # Nhưng vẫn giữ để kiểm tra các pattern đặc biệt
         AMBIGUOUS_CODES = {'THU', 'TIN', 'USD', 'CEO', 'CAR', 'HAI', 'VAN', 'NGO', 'BAO', 'QUA', 'NAM', 'TAO'}
         
-        # ✅ HÀM KIỂM TRA TÍN HIỆU RÕ RÀNG
-        def has_clear_signal(code, context):
-            """Kiểm tra xem có tín hiệu nhận diện rõ ràng không"""
-            context_upper = context.upper()
-            signal_patterns = [
-                r'CÔNG\s+TY\s+' + code,
-                r'MÃ\s+(?:CK|CHỨNG KHOÁN|CỔ PHIẾU)?\s*:\s*' + code,
-                r'CỔ\s+PHIẾU\s+' + code,
-                r'\(' + code + r'\s*[-–,]\s*(?:HNX|UPCOM|HOSE)\)',
-                r'\((?:HNX|UPCOM|HOSE)\s*[-–,:]\s*' + code + r'\)',
-                r'\(\s*' + code + r'\s*\)',  # (CEO)
-                r'\(\s*MÃ\s*:\s*' + code + r'\s*\)',  # (mã: CEO)
-                r'\(\s*MÃ\s+CỔ\s+PHIẾU\s*:\s*' + code + r'\s*\)',  # (mã cổ phiếu: CEO)
-                r'\b' + code + r'\s*[-–]\s*(?:HNX|UPCOM|HOSE)',  # CEO - HNX
-            ]
-            
-            for pattern in signal_patterns:
-                if re.search(pattern, context_upper):
-                    return True
-            return False
-        
         # 🔍 BƯỚC 1: QUÉT TOÀN BỘ BÀI TÌM TẤT CẢ MÃ (CASE-SENSITIVE)
-        all_stocks = list(self.hnx_stocks) + list(self.upcom_stocks) + list(self.hose_stocks)
+        # ✅ Tách 1 lần mọi cụm chữ HOA/số đứng riêng rồi tra tập mã
+        # (tương đương tìm r'\b' + code + r'\b' cho từng mã, nhưng không phụ thuộc số mã)
+        hits = [(match.group(), match.start()) for match in self._code_token_re.finditer(text_original)
+                if match.group() in self.all_codes]
+        for code in self._irregular_codes:
+            hits.extend((code, match.start()) for match in re.finditer(r'\b' + re.escape(code) + r'\b', text_original))
+        
         found_stocks = []  # [(code, exchange, position, has_signal)]
         
-        for code in all_stocks:
-            # ✅ TÌM MÃ CASE-SENSITIVE: chỉ khớp khi viết hoa đúng
-            # Pattern: word boundary + MÃ VIẾT HOA + word boundary
-            pattern = r'\b' + code + r'\b'
+        for code, position in hits:
+            context = text_original[max(0, position-40):min(len(text_original), position+40)]
             
-            # Tìm tất cả vị trí xuất hiện của mã (CASE-SENSITIVE)
-            for match in re.finditer(pattern, text_original):  # Dùng text_original thay vì text_upper
-                position = match.start()
-                context = text_original[max(0, position-40):min(len(text_original), position+40)]
-                
-                # Bỏ qua nếu là CTCK
-                context_upper = context.upper()
-                if re.search(r'CHỨNG KHOÁN\s+' + code, context_upper):
-                    continue
-                
-                # Xác định sàn
-                if code in self.hose_stocks:
-                    exchange = 'HOSE'
-                elif code in self.hnx_stocks:
-                    exchange = 'HNX'
-                else:
-                    exchange = 'UPCoM'
-                
-                # Kiểm tra tín hiệu
-                has_signal = has_clear_signal(code, context)
-                
-                found_stocks.append({
-                    'code': code,
-                    'exchange': exchange,
-                    'position': position,
-                    'has_signal': has_signal
-                })
+            # Bỏ qua nếu là CTCK
+            context_upper = context.upper()
+            if any(context_upper.startswith(code, m.end()) for m in self._ctck_re.finditer(context_upper)):
+                continue
+            
+            # Xác định sàn
+            if code in self.hose_stocks:
+                exchange = 'HOSE'
+            elif code in self.hnx_stocks:
+                exchange = 'HNX'
+            else:
+                exchange = 'UPCoM'
+            
+            # Kiểm tra tín hiệu
+            has_signal = self.has_clear_signal(code, context)
+            
+            found_stocks.append({
+                'code': code,
+                'exchange': exchange,
+                'position': position,
+                'has_signal': has_signal
+            })
         
         # Nếu không tìm thấy gì
         if not found_stocks:
@@ -623,6 +679,7 @@ class StockScraperWeb:
     def fetch_url(self, url, max_retries=2):
         for attempt in range(max_retries):
             try:
+                self.rate_limiter.acquire(url)
                 response = self.session.get(url, headers=self.headers, timeout=15)
                 response.raise_for_status()
                 return response
@@ -794,8 +851,6 @@ class StockScraperWeb:
                                 })
                             # else: bỏ qua bài viết quá cũ
                             
-                            time.sleep(0.3)
-                            
                             if len(all_crawled_articles) >= max_articles * 3:  # Cào nhiều hơn để lọc sau
                                 break
             
@@ -874,7 +929,6 @@ class StockScraperWeb:
         
         for url, name, pattern in sources:
             self.scrape_source(url, name, pattern, max_articles_per_source, progress_callback)
-            time.sleep(1)
         
         if len(self.all_articles) == 0:
             return None
@@ -972,7 +1026,7 @@ def main():
                 status_text.text(message)
                 progress_bar.progress(progress)
             
-            scraper = StockScraperWeb(stock_df, time_filter_hours=time_filter)
+            scraper = StockScraperWeb(stock_df, time_filter_hours=time_filter, rate_limiter=get_rate_limiter())
             df = scraper.run(max_articles_per_source=max_articles, progress_callback=update_progress)
             
             progress_bar.empty()
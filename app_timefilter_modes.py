@@ -15,8 +15,9 @@ from datetime import datetime, timedelta, timezone
 import time
 import re
 from dateutil import parser as dateparser
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import io
+import threading
 
 # ============================================================
 # CONFIG
@@ -291,18 +292,66 @@ class SimpleSentimentAnalyzer:
             "violations": keyword_analysis["violations"]
         }
 
+# ============================================================
+# RATE LIMITER
+# ============================================================
+
+class DomainRateLimiter:
+    """Giới hạn tốc độ request theo từng domain (token bucket)
+
+    Mỗi domain có 1 "xô" chứa tối đa `burst` token, được nạp lại với tốc độ
+    `requests_per_second`. Mỗi request lấy 1 token, hết token thì chờ.
+    Dùng chung 1 instance cho mọi thread để vẫn lịch sự khi cào song song.
+    """
+    def __init__(self, requests_per_second=2.0, burst=4, per_domain=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        # Cấu hình riêng cho từng site: {'cafef.vn': (requests_per_second, burst)}
+        self.per_domain = per_domain or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def _domain(self, url):
+        domain = urlparse(url).netloc.lower()
+        return domain[4:] if domain.startswith('www.') else domain
+    
+    def acquire(self, url):
+        """Chờ tới khi domain của url còn token rồi lấy 1 token"""
+        domain = self._domain(url)
+        rate, burst = self.per_domain.get(domain, (self.requests_per_second, self.burst))
+        if rate <= 0:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(domain, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self._buckets[domain] = (tokens - 1, now)
+                    return
+                self._buckets[domain] = (tokens, now)
+                wait_time = (1 - tokens) / rate
+            time.sleep(wait_time)
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter():
+    """Rate limiter dùng chung cho cả process - mọi lần chạy / người dùng chung xô token mỗi site"""
+    return DomainRateLimiter()
+
 # ============================================================
 # STOCK SCRAPER
 # ============================================================
 
 class StockScraperWeb:
-    def __init__(self, stock_df, time_mode='preset', time_filter_hours=24, date_from=None, date_to=None):
+    def __init__(self, stock_df, time_mode='preset', time_filter_hours=24, date_from=None, date_to=None, rate_limiter=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept-Language': 'vi-VN,vi;q=0.9,en;q=0.8',
         }
         self.all_articles = []
         self.session = requests.Session()
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
         self.time_filter_hours = time_filter_hours
         self.time_mode = time_mode
         self.date_from = date_from
@@ -315,7 +364,9 @@ class StockScraperWeb:
             self.cutoff_time = now_vn - timedelta(hours=time_filter_hours)
         else:
             # normalize dates to VN timezone day bounds if provided as date objects/strings
-            self.cutoff_time = Noneself.sentiment_analyzer = SimpleSentimentAnalyzer()
+            self.cutoff_time = None
+        
+        self.sentiment_analyzer = SimpleSentimentAnalyzer()
         
         # Load stock list
         self.stock_df = stock_df
@@ -556,6 +607,7 @@ class StockScraperWeb:
     def fetch_url(self, url, max_retries=2):
         for attempt in range(max_retries):
             try:
+                self.rate_limiter.acquire(url)
                 resp = self.session.get(url, headers=self.headers, timeout=15)
                 resp.raise_for_status()
                 return resp
@@ -710,8 +762,6 @@ class StockScraperWeb:
                             })
                             
                             count += 1
-                            time.sleep(0.5)
-                            
                             if count >= max_articles:
                                 break
             
@@ -729,7 +779,6 @@ class StockScraperWeb:
         
         for url, name, pattern in sources:
             self.scrape_source(url, name, pattern, max_articles_per_source, progress_callback)
-            time.sleep(1)
         
         if len(self.all_articles) == 0:
             return None
@@ -852,7 +901,8 @@ def main():
                                  time_mode=('preset' if time_mode == 'Khoảng thời gian đến hiện tại' else 'range'),
                                  time_filter_hours=time_filter,
                                  date_from=date_from,
-                                 date_to=date_to)
+                                 date_to=date_to,
+                                 rate_limiter=get_rate_limiter())
             df = scraper.run(max_articles_per_source=max_articles, progress_callback=update_progress)
             
             progress_bar.empty()
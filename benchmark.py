@@ -0,0 +1,502 @@
+# ============================================================
+# 📊 BENCHMARK - ĐO HIỆU NĂNG TOÀN BỘ PIPELINE CÀO TIN
+# ============================================================
+# ✅ Chạy StockScraperWeb.run() của 1 hoặc nhiều bản app (app_full_patched.py,
+#    app_timefilter_modes.py...) trên corpus giả lập hoặc archive đã ghi
+# ✅ Không ra mạng: mọi request đi qua 1 transport adapter nội bộ
+# ✅ Đo từng bước: tải / parse trang danh sách, tải / parse bài, fetch_article_content,
+#    extract_stock, advanced_summarize, analyze_sentiment, dựng DataFrame, xuất Excel
+# ✅ Báo cáo bài/giây, p50/p95 từng bước, bộ nhớ đỉnh (tracemalloc), lưu JSON
+#
+# Cách dùng:
+#   python benchmark.py                                   # app_full_patched.py, corpus giả lập
+#   python benchmark.py app_full_patched.py app_timefilter_modes.py --per-source 500
+#   python benchmark.py --archive .scraper_cache/archive.db   # phát lại dữ liệu đã ghi
+#   python benchmark.py --output new.json --compare old.json  # exit 1 nếu chậm đi
+# ============================================================
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+
+VIETNAM_TZ = timezone(timedelta(hours=7))
+
+# ============================================================
+# CORPUS
+# ============================================================
+
+# Đánh dấu trang danh sách trong corpus giả lập
+LISTING_MARKER = '<!-- bench:listing -->'
+
+SENTENCES = [
+    "Doanh thu thuần quý {q} đạt {n} tỷ đồng, tăng {p}% so với cùng kỳ năm trước",
+    "Lợi nhuận sau thuế đạt {n} tỷ đồng, hoàn thành {p}% kế hoạch năm",
+    "Cổ phiếu {code} đóng cửa phiên hôm qua ở mức {n} đồng, thanh khoản đạt {p} nghìn đơn vị",
+    "Hội đồng quản trị thông qua phương án phát hành {n} triệu cổ phiếu để tăng vốn điều lệ",
+    "Công ty cho biết đầu tư mở rộng nhà máy với tổng vốn {n} tỷ đồng trong năm {y}",
+    "Giá cổ phiếu giảm {p}% trong tuần qua do áp lực bán từ khối ngoại",
+    "Ban lãnh đạo kỳ vọng tăng trưởng mạnh nhờ các hợp đồng mới ký trong quý {q}",
+    "Theo báo cáo, nợ phải trả chiếm {p}% tổng nguồn vốn tại thời điểm cuối kỳ",
+]
+RISK_PHRASES = ['bất ngờ báo lỗ', 'tăng trần liên tiếp', 'khởi tố lãnh đạo', 'thâu tóm', 'lợi nhuận tăng', 'doanh thu kỷ lục']
+CODE_SIGNALS = ['(HNX: {code})', 'cổ phiếu {code}', 'Mã CK: {code}', '({code} - UPCOM)', 'CTCP {code}']
+
+
+class SyntheticCorpus:
+    """Corpus giả lập: sinh trang danh sách + bài viết theo URL được hỏi
+
+    Mọi trang danh sách (URL bất kỳ chưa biết) có `per_source` link. Link được
+    đặt sao cho khớp pattern của mọi nguồn trong run() (.chn, /yyyy/mm/...htm,
+    /chung-khoan/, -c111), nên không phụ thuộc danh sách nguồn của từng bản app.
+    Trang bài viết dùng markup giống site thật theo host (template) hoặc markup chung.
+    """
+    def __init__(self, codes, per_source=300, page_kb=120, seed=42):
+        self.codes = list(codes)
+        self.per_source = per_source
+        self.page_kb = page_kb
+        self.seed = seed
+        self.now = datetime.now(VIETNAM_TZ)
+        self.articles = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, key):
+        return random.Random(f"{self.seed}:{key}")
+
+    def listing(self, url):
+        slug = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+        items = []
+        for i in range(self.per_source):
+            href = f"/chung-khoan/{self.now:%Y/%m}/bai-{slug}-{i}-c111.chn.htm"
+            hours_ago = (i * 20.0) / self.per_source
+            code = self._rng(href).choice(self.codes)
+            # Bản app cũ chỉ lấy bài có mã CK ngay trong tiêu đề
+            prefix = f"{code}: " if i % 10 < 7 else ''
+            listed = (self.now - timedelta(hours=hours_ago)).strftime('%d/%m/%Y %H:%M')
+            items.append(
+                f'<div class="item"><h3><a href="{href}">{prefix}Tin doanh nghiệp số {i} của chuyên mục {slug} '
+                f'về kết quả kinh doanh</a></h3><span class="time">{listed}</span></div>'
+            )
+            with self._lock:
+                self.articles[href] = hours_ago
+        return f"{LISTING_MARKER}<html><body>{self._noise(self._rng(url), 0.2)}{''.join(items)}</body></html>"
+
+    def _noise(self, rng, fraction):
+        """Menu, script, tin liên quan... để trang có kích thước ~page_kb như site thật"""
+        target = int(self.page_kb * 1024 * fraction)
+        parts = []
+        size = 0
+        while size < target:
+            block = rng.choice([
+                '<div class="menu"><ul>' + ''.join(f'<li><a href="/muc-{k}">Chuyên mục {k}</a></li>' for k in range(20)) + '</ul></div>',
+                '<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments)}' + 'x' * rng.randint(200, 2000) + '</script>',
+                '<div class="box-related">' + ''.join(f'<div class="rel"><a href="/tin-{rng.randint(1, 10**6)}.html">Tin liên quan {k}</a><span class="icon"></span></div>' for k in range(10)) + '</div>',
+            ])
+            parts.append(block)
+            size += len(block)
+        return ''.join(parts)
+
+    def article(self, url):
+        path = urlparse(url).path
+        with self._lock:
+            hours_ago = self.articles.get(path)
+        if hours_ago is None:
+            return None
+        code = self._rng(path).choice(self.codes)
+        rng = self._rng(url)
+        sentences = []
+        for k in range(rng.randint(6, 14)):
+            sentences.append(rng.choice(SENTENCES).format(
+                q=rng.randint(1, 4), n=rng.randint(10, 9999), p=rng.randint(1, 99), y=self.now.year, code=code))
+        if rng.random() < 0.8:
+            sentences.insert(rng.randint(0, 2), 'Thông tin về ' + rng.choice(CODE_SIGNALS).format(code=code)
+                             + ' được công bố trong báo cáo mới nhất của doanh nghiệp')
+        if rng.random() < 0.3:
+            sentences.insert(rng.randint(0, len(sentences)), f"Doanh nghiệp {rng.choice(RISK_PHRASES)} theo thông tin mới nhất từ thị trường")
+        paragraphs = ''.join(f'<p>{s}.</p>' for s in sentences)
+
+        published = self.now - timedelta(hours=hours_ago)
+        host = urlparse(url).netloc.lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        head = ''
+        if host == 'cafef.vn':
+            date_html = f'<span class="pdate">{published:%d-%m-%Y - %I:%M %p}</span>'
+            body_html = f'<div class="detail-content afcbc-body">{paragraphs}</div>'
+        elif host == 'vietstock.vn':
+            date_html = f'<span class="datenew">{published:%d/%m/%Y %H:%M}</span>'
+            body_html = f'<div id="vst_detail" class="content">{paragraphs}</div>'
+        elif host == 'tinnhanhchungkhoan.vn':
+            date_html = f'<time class="time" datetime="{published.isoformat()}"></time>'
+            body_html = f'<div class="article__body cms-body">{paragraphs}</div>'
+        else:
+            head = f'<meta property="article:published_time" content="{published.isoformat()}">'
+            date_html = ''
+            body_html = f'<article>{paragraphs}</article>'
+        return (f'<html><head><title>Bài viết</title>{head}</head><body>{self._noise(rng, 0.3)}'
+                f'<h1 class="title">Bài viết</h1>{date_html}{body_html}{self._noise(rng, 0.7)}</body></html>')
+
+    def get(self, url):
+        """(status, headers, body bytes) cho url"""
+        body = self.article(url)
+        if body is None:
+            body = self.listing(url)
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, body.encode('utf-8')
+
+
+class ArchiveCorpus:
+    """Phát lại archive ghi bởi ResponseArchive (app_full_patched.py) - dùng được cho mọi bản app"""
+    def __init__(self, db_path):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @property
+    def now(self):
+        """Thời điểm ghi archive - app hỗ trợ reference_time sẽ lọc thời gian theo mốc này"""
+        row = self._conn.execute("SELECT value FROM archive_meta WHERE key = 'reference_time'").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT status, headers, body FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return 404, {}, b''
+        status, headers, body = row
+        return status, json.loads(headers), zlib.decompress(body)
+
+
+class CorpusAdapter(BaseAdapter):
+    """Transport adapter của requests: trả response từ corpus thay vì ra mạng"""
+    def __init__(self, corpus, latency=0.0):
+        super().__init__()
+        self.corpus = corpus
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+
+    def send(self, request, stream=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        status, headers, body = self.corpus.get(request.url)
+        self.requests += 1
+        self.bytes += len(body)
+        response = requests.Response()
+        response.status_code = status
+        response.url = request.url
+        response.request = request
+        response.headers.update(headers)
+        response.raw = io.BytesIO(body)
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+# ============================================================
+# ĐO THEO TỪNG BƯỚC
+# ============================================================
+
+class StageTimer:
+    """Gom thời gian từng lần gọi theo tên bước (an toàn khi chạy nhiều thread)"""
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+        self.local = threading.local()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage(*args, **kwargs) if callable(stage) else stage, time.perf_counter() - start)
+        return timed
+
+    def in_article(self):
+        return getattr(self.local, 'in_article', False)
+
+    def summary(self):
+        result = {}
+        for stage, values in sorted(self.samples.items()):
+            values = sorted(values)
+            result[stage] = {
+                'count': len(values),
+                'total_s': round(sum(values), 4),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p95_ms': round(percentile(values, 95) * 1000, 3),
+            }
+        return result
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def load_app(path):
+    """Import 1 bản app (chạy Streamlit ở chế độ bare, không mở UI)"""
+    name = 'bench_' + os.path.splitext(os.path.basename(path))[0].replace('.', '_').replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_stock_df(module, universe, seed):
+    """Danh sách mã mặc định của app + `universe` mã giả lập (HNX/UPCoM) để extract_stock chạy với quy mô thật"""
+    base = module.load_default_stock_list()
+    rng = random.Random(seed)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    existing = set(base['Mã CK'])
+    codes = []
+    while len(codes) < universe:
+        code = ''.join(rng.choice(letters) for _ in range(3))
+        if code not in existing:
+            existing.add(code)
+            codes.append(code)
+    extra = pd.DataFrame({
+        'Mã CK': codes,
+        'Sàn': [rng.choice(['HNX', 'UPCoM']) for _ in codes],
+        'Tên công ty': [f'Công ty cổ phần {code.lower()}group' for code in codes],
+    })
+    return pd.concat([base, extra], ignore_index=True)
+
+
+def build_scraper(module, stock_df, time_filter_hours, reference_time=None):
+    """Tạo StockScraperWeb với các tham số mà bản app này hỗ trợ"""
+    params = inspect.signature(module.StockScraperWeb.__init__).parameters
+    kwargs = {}
+    if 'time_filter_hours' in params:
+        kwargs['time_filter_hours'] = time_filter_hours
+    if 'reference_time' in params and reference_time is not None:
+        kwargs['reference_time'] = reference_time
+    if 'rate_limiter' in params and hasattr(module, 'DomainRateLimiter'):
+        # Không giới hạn tốc độ: chỉ đo phần xử lý
+        kwargs['rate_limiter'] = module.DomainRateLimiter(requests_per_second=0)
+    return module.StockScraperWeb(stock_df, **kwargs)
+
+
+def instrument(scraper, timer):
+    """Bọc các bước của pipeline trên instance scraper để đo thời gian"""
+    def article_stage(prefix):
+        return lambda *args, **kwargs: f"{prefix}_article" if timer.in_article() else f"{prefix}_listing"
+
+    fetch_article_content = scraper.fetch_article_content
+    def fetch_article_content_timed(*args, **kwargs):
+        timer.local.in_article = True
+        try:
+            return fetch_article_content(*args, **kwargs)
+        finally:
+            timer.local.in_article = False
+    scraper.fetch_article_content = timer.wrap('fetch_article_content', fetch_article_content_timed)
+    scraper.fetch_url = timer.wrap(article_stage('fetch'), scraper.fetch_url)
+    scraper.extract_stock = timer.wrap('extract_stock', scraper.extract_stock)
+    scraper.advanced_summarize = timer.wrap('advanced_summarize', scraper.advanced_summarize)
+    scraper.scrape_source = timer.wrap('scrape_source', scraper.scrape_source)
+    analyzer = scraper.sentiment_analyzer
+    analyzer.analyze_sentiment = timer.wrap('analyze_sentiment', analyzer.analyze_sentiment)
+    return article_stage('parse')
+
+
+def run_once(module, args, corpus, timer=None):
+    stock_df = make_stock_df(module, args.universe, args.seed)
+    scraper = build_scraper(module, stock_df, args.time_filter_hours, corpus.now)
+    adapter = CorpusAdapter(corpus, latency=args.latency_ms / 1000)
+    scraper.session.mount('https://', adapter)
+    scraper.session.mount('http://', adapter)
+
+    # Đo parse HTML: bọc BeautifulSoup của module (make_soup cũng gọi qua đây)
+    original_soup = module.BeautifulSoup
+    if timer is not None:
+        parse_stage = instrument(scraper, timer)
+        module.BeautifulSoup = timer.wrap(parse_stage, original_soup)
+
+    run_params = inspect.signature(scraper.run).parameters
+    run_kwargs = {'max_articles_per_source': args.per_source}
+    if 'parallel_sources' in run_params:
+        run_kwargs['parallel_sources'] = not args.sequential
+    try:
+        start = time.perf_counter()
+        df = scraper.run(**run_kwargs)
+        wall = time.perf_counter() - start
+    finally:
+        module.BeautifulSoup = original_soup
+
+    # Dựng DataFrame + xuất Excel như nút tải về trong main() (dùng hàm xuất của app nếu có)
+    rows = list(scraper.all_articles)
+    start = time.perf_counter()
+    built = pd.DataFrame(rows)
+    if len(built):
+        built = built.drop_duplicates(subset=['Tiêu đề'], keep='first')
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    if hasattr(module, 'write_excel_streaming') and len(built):
+        module.write_excel_streaming(built, buffer)
+    else:
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            built.to_excel(writer, index=False, sheet_name='Tất cả')
+    export_s = time.perf_counter() - start
+    if timer is not None:
+        timer.add('dataframe_build', build_s)
+        timer.add('excel_export', export_s)
+
+    articles = timer.samples.get('fetch_article_content', []) if timer is not None else []
+    diagnostics = scraper.stats.get('diagnostics') or {}
+    return {
+        'first_result_s': diagnostics.get('first_result_s'),
+        'wall_s': wall,
+        'articles': len(articles),
+        'rows': 0 if df is None else len(df),
+        'requests': adapter.requests,
+        'bytes': adapter.bytes,
+        'excel_bytes': buffer.getbuffer().nbytes,
+    }
+
+
+def benchmark_app(path, args):
+    module = load_app(path)
+    codes = list(make_stock_df(module, args.universe, args.seed)['Mã CK'])
+    make_corpus = (lambda: ArchiveCorpus(args.archive)) if args.archive else (
+        lambda: SyntheticCorpus(codes, per_source=args.per_source, page_kb=args.page_kb, seed=args.seed))
+
+    timer = StageTimer()
+    outcome = run_once(module, args, make_corpus(), timer)
+    result = {
+        'app': os.path.basename(path),
+        'articles': outcome['articles'],
+        'rows': outcome['rows'],
+        'requests': outcome['requests'],
+        'mb_served': round(outcome['bytes'] / 1024 / 1024, 2),
+        'wall_s': round(outcome['wall_s'], 3),
+        'articles_per_s': round(outcome['articles'] / outcome['wall_s'], 2) if outcome['wall_s'] else 0.0,
+        'first_result_s': None if outcome['first_result_s'] is None else round(outcome['first_result_s'], 3),
+        'stages': timer.summary(),
+    }
+
+    if not args.no_memory:
+        # Lượt riêng có tracemalloc (chậm hơn nhiều) - chỉ lấy bộ nhớ đỉnh
+        tracemalloc.start()
+        try:
+            run_once(module, args, make_corpus())
+            result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+# ============================================================
+# BÁO CÁO + SO SÁNH
+# ============================================================
+
+def print_result(result):
+    print(f"\n=== {result['app']} ===")
+    print(f"{result['articles']} bài | {result['rows']} dòng kết quả | {result['requests']} request | "
+          f"{result['mb_served']} MB | {result['wall_s']} s | {result['articles_per_s']} bài/s"
+          + (f" | kết quả đầu tiên sau {result['first_result_s']} s" if result.get('first_result_s') is not None else '')
+          + (f" | bộ nhớ đỉnh {result['peak_memory_mb']} MB" if 'peak_memory_mb' in result else ''))
+    print(f"{'bước':<24}{'số lần':>8}{'tổng (s)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for stage, s in result['stages'].items():
+        print(f"{stage:<24}{s['count']:>8}{s['total_s']:>12.3f}{s['p50_ms']:>12.3f}{s['p95_ms']:>12.3f}")
+
+
+def compare(results, baseline_path, threshold):
+    """So với file JSON trước đó; trả về danh sách các chỉ số chậm đi quá threshold"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r['app']: r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get(result['app'])
+        if old is None:
+            print(f"\n(không có {result['app']} trong {baseline_path} - bỏ qua so sánh)")
+            continue
+        print(f"\n=== {result['app']}: so với {baseline_path} ===")
+        ratio = result['articles_per_s'] / old['articles_per_s'] if old['articles_per_s'] else float('inf')
+        print(f"bài/s: {old['articles_per_s']} -> {result['articles_per_s']} (x{ratio:.2f})")
+        if ratio < 1 - threshold:
+            regressions.append(f"{result['app']}: bài/s x{ratio:.2f}")
+        for stage, s in result['stages'].items():
+            old_stage = old['stages'].get(stage)
+            if not old_stage or not old_stage['p95_ms']:
+                continue
+            change = s['p95_ms'] / old_stage['p95_ms']
+            flag = '  ⚠️' if change > 1 + threshold else ''
+            print(f"  {stage:<24} p95 {old_stage['p95_ms']:>10.3f} -> {s['p95_ms']:>10.3f} ms (x{change:.2f}){flag}")
+            if flag:
+                regressions.append(f"{result['app']}: {stage} p95 x{change:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline cào tin (không ra mạng)")
+    parser.add_argument('apps', nargs='*', default=['app_full_patched.py'], help="Các file app cần đo")
+    parser.add_argument('--per-source', type=int, default=300, help="Số bài trên mỗi trang danh sách (corpus giả lập)")
+    parser.add_argument('--page-kb', type=int, default=120, help="Kích thước mỗi trang giả lập (KB)")
+    parser.add_argument('--universe', type=int, default=1500, help="Số mã CK giả lập thêm vào danh sách mã")
+    parser.add_argument('--archive', help="Phát lại archive SQLite ghi bởi ResponseArchive thay cho corpus giả lập")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Độ trễ giả lập cho mỗi request")
+    parser.add_argument('--time-filter-hours', type=int, default=24)
+    parser.add_argument('--sequential', action='store_true', help="Cào lần lượt từng nguồn (nếu app hỗ trợ song song)")
+    parser.add_argument('--no-memory', action='store_true', help="Bỏ lượt đo bộ nhớ bằng tracemalloc")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Lưu kết quả JSON")
+    parser.add_argument('--compare', help="File JSON kết quả cũ để so sánh")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Ngưỡng chậm đi bị coi là regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    # Các lệnh st.* của app chạy ở bare mode: tắt cảnh báo "missing ScriptRunContext"
+    logging.disable(logging.WARNING)
+
+    results = []
+    for path in args.apps:
+        result = benchmark_app(path, args)
+        print_result(result)
+        results.append(result)
+
+    report = {
+        'created_at': datetime.now(VIETNAM_TZ).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('apps', 'output', 'compare')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã lưu {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print("\n❌ Chậm đi:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\n✅ Không có regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
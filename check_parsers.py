@@ -0,0 +1,152 @@
+# ============================================================
+# 🧪 KIỂM TRA PARSER HTML - KẾT QUẢ PHẢI GIỐNG HTML.PARSER GỐC
+# ============================================================
+# ✅ Phát lại 1 archive đã ghi (ResponseArchive) qua app với từng parser (lxml, html.parser)
+# ✅ So từng trang với giá trị mong đợi đã lưu: ngày đăng, nội dung, mã CK; và các dòng
+#    (Link, Mã CK, Ngày) của run()
+# ✅ Giá trị mong đợi dựng bằng BeautifulSoup(markup, 'html.parser') như trước khi có lxml -
+#    không qua make_soup / TagStrainer - và được lưu lại, nên lỗi chung của cả 2 parser
+#    (template, find_first, lọc đoạn văn...) cũng bị phát hiện
+# ✅ Không ra mạng
+#
+# Cách dùng:
+#   python check_parsers.py                      # corpus mẫu: fixtures/parser_corpus.db
+#   python check_parsers.py --write-expected     # dựng lại giá trị mong đợi (sau khi đổi corpus
+#                                                # hoặc đổi cách trích xuất có chủ đích)
+#   python check_parsers.py --archive .scraper_cache/archive.db --expected archive_expected.json --write-expected
+#
+# fixtures/parser_corpus.db dựng bằng fixtures/make_parser_corpus.py (trang dựng sẵn theo
+# khung HTML của từng nguồn, không phải trang thật). Thoát với mã 1 nếu có khác biệt.
+# ============================================================
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+from benchmark import load_app
+
+PARSERS = ('lxml', 'html.parser')
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_ARCHIVE = os.path.join(FIXTURES, 'parser_corpus.db')
+DEFAULT_EXPECTED = os.path.join(FIXTURES, 'parser_corpus_expected.json')
+FIELDS = ('date', 'content', 'code')
+
+# ============================================================
+# TRÍCH XUẤT
+# ============================================================
+
+def baseline_soup(markup, parse_only=None):
+    """Cách dựng soup trước khi có lxml: cả cây, html.parser"""
+    return BeautifulSoup(markup, 'html.parser')
+
+
+def extract_all(app_path, parser, archive_path, time_filter_hours, baseline=False):
+    """({url: {date, content, code}}, [[Link, Mã CK, Ngày], ...] của run()) khi app dùng `parser`
+
+    baseline=True: bỏ qua make_soup của app, dựng mọi trang bằng baseline_soup.
+    """
+    os.environ['SCRAPER_HTML_PARSER'] = parser
+    try:
+        module = load_app(app_path)
+    finally:
+        del os.environ['SCRAPER_HTML_PARSER']
+    assert module.HTML_PARSER == parser
+    if baseline:
+        module.make_soup = baseline_soup
+
+    def make_scraper():
+        return module.StockScraperWeb(
+            module.load_default_stock_list(),
+            time_filter_hours=time_filter_hours,
+            rate_limiter=module.DomainRateLimiter(requests_per_second=0),
+            archive=module.ResponseArchive(archive_path, mode='replay'),
+        )
+
+    scraper = make_scraper()
+    pages = {}
+    for url in scraper.archive.urls():
+        content, date_str, _ = scraper.fetch_article_content(url)
+        code = None
+        if content:
+            article_text = module.ArticleText('', content)
+            code = scraper.extract_stock(article_text.raw, article_text=article_text)[0]
+        pages[url] = {'date': date_str, 'content': content, 'code': code}
+
+    df = make_scraper().run(max_articles_per_source=50)
+    rows = [] if df is None else df[['Link', 'Mã CK', 'Ngày']].values.tolist()
+    return pages, rows
+
+# ============================================================
+# SO SÁNH
+# ============================================================
+
+def compare(parser, pages, rows, expected):
+    """Danh sách khác biệt so với giá trị mong đợi (rỗng = giống hệt)"""
+    diffs = []
+    for url in sorted(set(expected['pages']) | set(pages)):
+        want, got = expected['pages'].get(url), pages.get(url)
+        if want is None or got is None:
+            diffs.append(f"{parser}: {url} {'không có trong giá trị mong đợi' if want is None else 'không còn trong archive'}")
+            continue
+        for field in FIELDS:
+            if want[field] != got[field]:
+                diffs.append(f"{parser}: {url}: {field} khác\n    mong đợi: {str(want[field])[:200]!r}\n"
+                             f"    {parser}: {str(got[field])[:200]!r}")
+    if rows != expected['run']:
+        missing = [row for row in expected['run'] if row not in rows]
+        extra = [row for row in rows if row not in expected['run']]
+        diffs.append(f"{parser}: run() {len(rows)} dòng, mong đợi {len(expected['run'])} dòng"
+                     f" | thiếu: {missing[:5]} | thừa: {extra[:5]}"
+                     + (" | khác thứ tự" if not missing and not extra else ""))
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So kết quả trích xuất của lxml / html.parser với html.parser gốc trên 1 archive")
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE, help="archive ghi bởi ResponseArchive (mặc định: corpus mẫu)")
+    parser.add_argument('--expected', default=DEFAULT_EXPECTED, help="file JSON giá trị mong đợi")
+    parser.add_argument('--app', default='app_full_patched.py', help="bản app cần kiểm tra")
+    parser.add_argument('--time-filter-hours', type=int, default=24 * 365)
+    parser.add_argument('--write-expected', action='store_true',
+                        help="dựng giá trị mong đợi bằng html.parser gốc rồi ghi ra --expected")
+    args = parser.parse_args()
+
+    # Streamlit chạy bare mode khi import app - bỏ các cảnh báo không liên quan
+    logging.disable(logging.WARNING)
+    if not os.path.exists(args.archive):
+        sys.exit(f"Không tìm thấy archive: {args.archive}")
+
+    if args.write_expected:
+        pages, rows = extract_all(args.app, 'html.parser', args.archive, args.time_filter_hours, baseline=True)
+        with open(args.expected, 'w', encoding='utf-8') as f:
+            json.dump({'archive': os.path.basename(args.archive), 'time_filter_hours': args.time_filter_hours,
+                       'pages': pages, 'run': rows}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"Đã ghi {args.expected}: {len(pages)} trang | run(): {len(rows)} dòng")
+        return
+
+    if not os.path.exists(args.expected):
+        sys.exit(f"Không tìm thấy giá trị mong đợi: {args.expected} (chạy với --write-expected)")
+    with open(args.expected, encoding='utf-8') as f:
+        expected = json.load(f)
+
+    diffs = []
+    for name in PARSERS:
+        pages, rows = extract_all(args.app, name, args.archive, expected.get('time_filter_hours', args.time_filter_hours))
+        diffs += compare(name, pages, rows, expected)
+    print(f"{len(expected['pages'])} trang | {sum(1 for page in expected['pages'].values() if page['content'])} trang có nội dung | "
+          f"{sum(1 for page in expected['pages'].values() if page['code'])} trang có mã CK | run(): {len(expected['run'])} dòng")
+
+    if diffs:
+        print(f"❌ {len(diffs)} khác biệt so với html.parser gốc:")
+        for diff in diffs:
+            print('  - ' + diff)
+        sys.exit(1)
+    print(f"✅ {' / '.join(PARSERS)} cho cùng ngày đăng, nội dung, mã CK và kết quả run() như html.parser gốc")
+
+
+if __name__ == '__main__':
+    main()
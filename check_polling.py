@@ -0,0 +1,193 @@
+# ============================================================
+# 🧪 KIỂM TRA POLL LIÊN TỤC (INCREMENTAL) - LẦN POLL SAU KHÔNG TẢI LẠI BÀI
+# ============================================================
+# ✅ Phát lại corpus fixtures/parser_corpus.db (ResponseArchive) với seen store mới
+# ✅ Poll 1 tải mọi bài; poll 2 (cùng trang danh sách) không tải bài nào và cho cùng
+#    kết quả - kể cả bài cũ hơn mốc lọc và link tải lỗi
+# ✅ Link tải lỗi được tải lại sau SEEN_RETRY_SECONDS
+# ✅ Cache HTTP trên đĩa không lớn mãi: URL quá hạn / vượt dung lượng bị xoá khi mở cache
+#    và sau mỗi run()
+# ✅ Không ra mạng
+#
+# Cách dùng:
+#   python check_polling.py
+# Thoát với mã 1 nếu có kiểm tra không đạt.
+# ============================================================
+
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmark import load_app
+from check_parsers import DEFAULT_ARCHIVE
+
+# Trang danh sách của run() - mọi link khác trong archive là bài
+LISTING_URLS = {
+    "https://cafef.vn/thi-truong-chung-khoan.chn",
+    "https://vietstock.vn/chung-khoan.htm",
+    "https://nguoiquansat.vn/chung-khoan",
+    "https://baomoi.com/chung-khoan.epi",
+    "https://www.tinnhanhchungkhoan.vn/chung-khoan/",
+    "https://www.tinnhanhchungkhoan.vn/doanh-nghiep/",
+}
+
+# ============================================================
+# POLL
+# ============================================================
+
+def make_poller(module, archive_path, seen_path, time_filter_hours):
+    """poll(**thuộc tính scraper) -> (các link bài đã tải, các dòng (Link, Mã CK) của run())"""
+    class CountingArchive(module.ResponseArchive):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.fetched = []
+
+        def replay(self, url):
+            self.fetched.append(url)
+            return super().replay(url)
+
+    def poll(**overrides):
+        archive = CountingArchive(archive_path, mode='replay')
+        scraper = module.StockScraperWeb(
+            module.load_default_stock_list(),
+            time_filter_hours=time_filter_hours,
+            rate_limiter=module.DomainRateLimiter(requests_per_second=0),
+            archive=archive,
+            seen_store=module.SeenArticleStore(seen_path),
+        )
+        for name, value in overrides.items():
+            setattr(scraper, name, value)
+        df = scraper.run(max_articles_per_source=50)
+        rows = [] if df is None else df[['Link', 'Mã CK']].values.tolist()
+        articles = [url for url in archive.fetched if url not in LISTING_URLS]
+        return articles, rows
+
+    return poll
+
+
+# ============================================================
+# CACHE HTTP
+# ============================================================
+
+def check_http_cache(module, cache_dir, poll):
+    """Danh sách kiểm tra không đạt của HttpDiskCache.prune (rỗng = đạt)"""
+    failures = []
+    now = time.time()
+
+    def put(cache, url, age, size=2048):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['ETag'] = f'"{url}"'
+        response._content = b'x' * size
+        cache.put(url, response)
+        for ext in ('body', 'json'):
+            os.utime(cache._path(url, ext), (now - age, now - age))
+
+    def cached(cache, urls):
+        return [url for url in urls if cache.get(url) is not None]
+
+    def cache_bytes():
+        return sum(entry.stat().st_size for entry in os.scandir(cache_dir))
+
+    # 8 URL x ~2 KB, 2 URL quá hạn, 1 file .body lẻ; giới hạn 10 KB -> còn các URL mới nhất
+    cache = module.HttpDiskCache(cache_dir, max_age=3600, max_bytes=10 * 1024)
+    urls = [f'https://cafef.vn/bai-{i}.chn' for i in range(8)]
+    for i, url in enumerate(urls):
+        put(cache, url, age=7200 if i < 2 else 600 - i)
+    with open(os.path.join(cache_dir, 'deadbeef.body'), 'wb') as f:
+        f.write(b'x' * 100)
+    removed = cache.prune()
+    kept = cached(cache, urls)
+    kept_bytes = cache_bytes()
+    if cached(cache, urls[:2]):
+        failures.append(f"cache: URL quá max_age vẫn còn: {cached(cache, urls[:2])}")
+    if os.path.exists(os.path.join(cache_dir, 'deadbeef.body')):
+        failures.append("cache: file .body lẻ không bị xoá")
+    if kept_bytes > cache.max_bytes:
+        failures.append(f"cache: {kept_bytes} byte sau prune, giới hạn {cache.max_bytes}")
+    if not kept or kept != urls[-len(kept):]:
+        failures.append(f"cache: phải giữ các URL mới nhất, còn lại: {kept}")
+
+    # Mở lại cache -> prune
+    put(cache, urls[-1], age=7200)
+    reopened = module.HttpDiskCache(cache_dir, max_age=3600, max_bytes=10 * 1024)
+    if cached(reopened, urls[-1:]):
+        failures.append("cache: mở lại cache không xoá URL quá hạn")
+
+    # Sau run()
+    put(reopened, urls[-2], age=7200)
+    poll(http_cache=reopened)
+    if cached(reopened, urls[-2:-1]):
+        failures.append("cache: run() không xoá URL quá hạn")
+
+    print(f"Cache HTTP: prune xoá {removed} URL, còn {len(kept)} URL / {kept_bytes} byte "
+          f"(giới hạn {cache.max_bytes} byte, {cache.max_age} giây)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll 2 lần trên corpus ghi sẵn: lần sau không được tải lại bài nào")
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE, help="archive ghi bởi ResponseArchive (mặc định: corpus mẫu)")
+    parser.add_argument('--app', default='app_full_patched.py', help="bản app cần kiểm tra")
+    # Corpus có bài đăng từ 1 giờ tới gần 12 giờ trước - 6 giờ để có cả bài cũ hơn mốc lọc
+    parser.add_argument('--time-filter-hours', type=int, default=6)
+    args = parser.parse_args()
+
+    # Streamlit chạy bare mode khi import app - bỏ các cảnh báo không liên quan
+    logging.disable(logging.WARNING)
+    module = load_app(args.app)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Bỏ 1 bài khỏi bản sao archive -> link đó tải lỗi
+        archive_path = os.path.join(tmp, 'archive.db')
+        shutil.copy(args.archive, archive_path)
+        conn = sqlite3.connect(archive_path)
+        with conn:
+            broken = conn.execute(
+                "SELECT url FROM responses WHERE url NOT IN ({}) ORDER BY url LIMIT 1".format(','.join('?' * len(LISTING_URLS))),
+                sorted(LISTING_URLS)
+            ).fetchone()[0]
+            conn.execute("DELETE FROM responses WHERE url = ?", (broken,))
+        conn.close()
+
+        poll = make_poller(module, archive_path, os.path.join(tmp, 'seen.db'), args.time_filter_hours)
+        first_fetched, first_rows = poll()
+        second_fetched, second_rows = poll()
+        retry_fetched, retry_rows = poll(SEEN_RETRY_SECONDS=0)
+        failures += check_http_cache(module, os.path.join(tmp, 'http'), poll)
+
+    print(f"Poll 1: tải {len(first_fetched)} bài, {len(first_rows)} dòng | "
+          f"poll 2: tải {len(second_fetched)} bài, {len(second_rows)} dòng | "
+          f"hết hạn thử lại: tải {len(retry_fetched)} bài")
+    if broken not in first_fetched:
+        failures.append(f"poll 1 không tải link lỗi {broken}")
+    if not first_rows:
+        failures.append("poll 1 không có dòng kết quả nào")
+    if second_fetched:
+        failures.append(f"poll 2 vẫn tải {len(second_fetched)} bài: {second_fetched[:5]}")
+    if second_rows != first_rows:
+        failures.append(f"poll 2 cho kết quả khác poll 1: {len(second_rows)} / {len(first_rows)} dòng")
+    if retry_fetched != [broken]:
+        failures.append(f"sau SEEN_RETRY_SECONDS chỉ được tải lại link lỗi, đã tải: {retry_fetched[:5]}")
+    if retry_rows != first_rows:
+        failures.append(f"poll 3 cho kết quả khác poll 1: {len(retry_rows)} / {len(first_rows)} dòng")
+
+    if failures:
+        print(f"❌ {len(failures)} kiểm tra không đạt:")
+        for failure in failures:
+            print('  - ' + failure)
+        sys.exit(1)
+    print("✅ Poll lặp lại không tải lại bài đã xử lý, bài cũ hơn mốc lọc hay link lỗi (trước hạn thử lại); "
+          "cache HTTP giữ trong giới hạn")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# ============================================================
+# 🧪 DỰNG CORPUS CHO check_parsers.py - fixtures/parser_corpus.db
+# ============================================================
+# ✅ Trang dựng sẵn theo khung HTML của từng nguồn (head nhiều meta / script, menu, cột
+#    phải, tin liên quan, footer - ~60 KB / trang), không phải trang tải từ site thật
+# ✅ Mỗi nguồn 6 bài, mỗi bài 1 kiểu markup lỗi thường gặp: <p> không đóng, thẻ / thuộc
+#    tính viết hoa không ngoặc kép, </div> trong script + comment, bảng / thẻ lồng sai,
+#    thiếu </body>, </p> thừa; ngày đăng ở template / meta / JSON-LD / không có
+# ✅ Ghi bằng ResponseArchive (record) qua run() của app - giống hệt "Archive: record" trên UI
+#
+# Cách dùng (từ thư mục gốc repo):
+#   python fixtures/make_parser_corpus.py
+#   python check_parsers.py --write-expected     # cập nhật giá trị mong đợi
+#
+# Có mạng thì nên thay bằng bản ghi trang thật: chạy app với Archive: record rồi
+#   python check_parsers.py --archive .scraper_cache/archive.db --expected <file.json> --write-expected
+# ============================================================
+
+import io
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import BaseAdapter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from benchmark import load_app  # noqa: E402
+
+OUTPUT = os.path.join(HERE, 'parser_corpus.db')
+CODES = ['SHS', 'PVS', 'NVB', 'VCS', 'BVS', 'CEO', 'VGC', 'PVC', 'LPB', 'EIB', 'BAB', 'HDG', 'PAN']
+SENTENCES = [
+    "Doanh thu thuần quý 3 của {c} đạt 1.234 tỷ đồng, tăng 25% so với cùng kỳ năm trước theo báo cáo tài chính",
+    "Lợi nhuận sau thuế của công ty đạt 456 tỷ đồng, hoàn thành 80% kế hoạch năm mà đại hội cổ đông đã đề ra",
+    "Cổ phiếu {c} (HNX: {c}) đóng cửa ở mức 23.500 đồng, thanh khoản đạt 3,2 triệu đơn vị trong phiên",
+    "Hội đồng quản trị thông qua phương án phát hành 50 triệu cổ phiếu để tăng vốn điều lệ trong năm nay",
+    "Theo giới phân tích, doanh nghiệp có thể bất ngờ báo lỗ nếu giá nguyên liệu tiếp tục tăng mạnh trong quý tới",
+]
+FILLER = [
+    "Thị trường chứng khoán phiên hôm nay ghi nhận thanh khoản cải thiện ở nhóm cổ phiếu ngân hàng và bất động sản",
+    "Khối ngoại tiếp tục bán ròng trên sàn HOSE với giá trị hơn 300 tỷ đồng, tập trung ở nhóm vốn hóa lớn",
+    "Chỉ số VN-Index đóng cửa tăng nhẹ sau khi dao động quanh mốc tham chiếu trong phần lớn thời gian giao dịch",
+    "Ngân hàng Nhà nước tiếp tục bơm ròng qua kênh thị trường mở, lãi suất liên ngân hàng giảm ở các kỳ hạn ngắn",
+]
+
+# (trang danh sách, đường dẫn bài, thẻ ngày đăng, mở / đóng thân bài) - khớp SOURCE_TEMPLATES
+SOURCES = {
+    'cafef': ('https://cafef.vn/thi-truong-chung-khoan.chn', lambda i: f'/bai-viet-so-{i}-188{i:04d}.chn',
+              lambda d: f'<span class="pdate" data-role="publishdate">{d:%d-%m-%Y - %I:%M %p}</span>',
+              '<div class="detail-content afcbc-body" data-role="content">', '</div>'),
+    'vietstock': ('https://vietstock.vn/chung-khoan.htm', lambda i: f'/2026/10/bai-viet-{i}-830-{i}.htm',
+                  lambda d: f'<span class=datenew>{d:%d/%m/%Y %H:%M}</span>',
+                  '<div id="vst_detail" class="content">', '</div>'),
+    'nguoiquansat': ('https://nguoiquansat.vn/chung-khoan', lambda i: f'/chung-khoan/bai-viet-{i}-{1000 + i}.html',
+                     lambda d: f'<span class="c-detail-head__time">{d:%H:%M | %d/%m/%Y}</span>',
+                     '<div class="c-news-detail">', '</div>'),
+    'baomoi': ('https://baomoi.com/chung-khoan.epi', lambda i: f'/bai-viet-so-{i}-c111{i}.epi',
+               lambda d: f'<time datetime="{d.isoformat()}">{d:%d/%m/%Y}</time>',
+               '<div class="content-body">', '</div>'),
+    'tnck_ck': ('https://www.tinnhanhchungkhoan.vn/chung-khoan/', lambda i: f'/chung-khoan/bai-viet-{i}-post{3000 + i}.html',
+                lambda d: f'<time class="time" datetime="{d.isoformat()}"></time>',
+                '<div class="article__body cms-body">', '</div>'),
+    'tnck_dn': ('https://www.tinnhanhchungkhoan.vn/doanh-nghiep/', lambda i: f'/doanh-nghiep/bai-viet-{i}-post{4000 + i}.html',
+                lambda d: f'<span class="time">{d:%d/%m/%Y %H:%M}</span>',
+                '<div class="article__body">', '</div>'),
+}
+
+# ============================================================
+# KHUNG TRANG
+# ============================================================
+
+def head(rng, title, extra=''):
+    metas = ''.join(f'<meta name="meta-{k}" content="{rng.choice(FILLER)}">' for k in range(12))
+    css = ''.join(f'<link rel="stylesheet" href="/static/css/site-{k}.css?v={rng.randint(1, 999)}">' for k in range(6))
+    tracking = ';'.join(f'window.cfg{k}={{"slot":"div-gpt-ad-{k}","size":[[300,250],[728,90]],"targeting":{{"cat":"chung-khoan"}}}}'
+                        for k in range(400))
+    breadcrumb = ('<script type="application/ld+json">{"@context":"https://schema.org","@type":"BreadcrumbList",'
+                  '"itemListElement":[{"@type":"ListItem","position":1,"name":"Chứng khoán"}]}</script>')
+    return (f'<head><meta charset="utf-8"><title>{title}</title>'
+            f'<meta property="og:title" content="{title}">{metas}{css}{breadcrumb}{extra}'
+            f'<script>{tracking}</script></head>')
+
+
+def header(rng):
+    menu = ''.join(f'<li class="menu-item"><a href="/chuyen-muc-{k}.html">Chuyên mục {k}</a></li>' for k in range(40))
+    return (f'<header class="site-header"><div class="logo"><a href="/"><img src="/logo.svg" alt="logo"></a></div>'
+            f'<nav class="main-nav"><ul>{menu}</ul></nav>'
+            f'<form class="search" action="/tim-kiem"><input type="text" name="q" placeholder="Tìm kiếm"></form></header>')
+
+
+def sidebar(rng):
+    latest = ''.join(
+        f'<li class="sidebar-item"><a href="/tin-moi-{k}.html"><img src="/thumb/{k}.jpg" alt=""></a>'
+        f'<h4><a href="/tin-moi-{k}.html">Tin mới số {k}</a></h4><p class="sapo">{rng.choice(FILLER)}.</p></li>'
+        for k in range(30)
+    )
+    ads = ''.join(f'<div class="ads" id="div-gpt-ad-{k}"><script>googletag.cmd.push(function(){{googletag.display("div-gpt-ad-{k}");}});</script></div>'
+                  for k in range(4))
+    return f'<aside class="sidebar"><div class="box"><h3>Tin mới nhất</h3><ul>{latest}</ul></div>{ads}</aside>'
+
+
+def footer(rng):
+    links = ''.join(f'<a href="/trang-{k}.html">Trang {k}</a>' for k in range(20))
+    return (f'<footer class="site-footer"><div class="links">{links}</div>'
+            '<p>Cơ quan chủ quản: Công ty cổ phần truyền thông, giấy phép số 1234/GP-BTTTT cấp ngày 01/01/2020</p>'
+            '<p>Địa chỉ: Tầng 10, tòa nhà văn phòng, quận Hoàn Kiếm, Hà Nội. Điện thoại: 024 1234 5678</p></footer>')
+
+
+def related(rng):
+    items = ''.join(f'<li><a href="/lien-quan-{k}.html">Tin liên quan {k}</a><p>{rng.choice(FILLER)}.</p></li>' for k in range(8))
+    return f'<div class="related-news"><h3>Tin liên quan</h3><ul>{items}</ul></div>'
+
+# ============================================================
+# THÂN BÀI - MỖI KIỂU 1 LỖI MARKUP
+# ============================================================
+
+def body_clean(sents, body_open, body_close):
+    ps = [f'<p>{s}.</p>' for s in sents]
+    figure = '<figure class="image"><img src="/anh/1.jpg" alt=""><figcaption>Ảnh minh họa</figcaption></figure>'
+    return (body_open + ''.join(ps[:2]) + figure + ''.join(ps[2:])
+            + '<p class="author"><strong>Minh Anh</strong></p>' + body_close)
+
+
+def body_unclosed_p(sents, body_open, body_close):
+    return body_open + ''.join(f'<p>{s}.' for s in sents) + body_close
+
+
+def body_upper_unquoted(sents, body_open, body_close):
+    ps = ''.join(f'<P CLASS=para>{s} &amp; th&#244;ng tin&nbsp;th&ecirc;m.</P>' for s in sents)
+    return f'{body_open}{ps}<P ALIGN=right><EM>Theo Báo cáo</EM></P>{body_close}'
+
+
+def body_script_comment(sents, body_open, body_close):
+    ps = ''.join(
+        f'<p>{s}.<br>Dòng thứ hai<br/>của đoạn.</p>'
+        '<!-- <p>quảng cáo ẩn không được tính vào nội dung bài viết này</p> -->'
+        '<script>var s="</div><p>fake</p>";</script>'
+        for s in sents
+    )
+    return body_open + ps + body_close
+
+
+def body_nested_table(sents, body_open, body_close):
+    table = ''.join(f'<tr><td>Quý {q}</td><td>{q * 111} tỷ</td></tr>' for q in range(1, 5))
+    return (f'{body_open}<div class="inner"><div><p>{sents[0]}.</p></div>'
+            f'<table class="data"><tr><td><p>{sents[1]}.</p></td></tr>{table}</table>'
+            f'<span><p>{sents[2]}.</p></span><p><a href="/tag">{sents[3]}</a>.</p></div>')  # thiếu </div> thân bài
+
+
+def body_stray_close(sents, body_open, body_close):
+    ps = ''.join(f'<p>{s}.</p></p></span>' for s in sents)
+    return f'<div class="wrap">{body_open}{ps}{body_close}</div></div>'
+
+
+VARIANTS = [body_clean, body_unclosed_p, body_upper_unquoted, body_script_comment, body_nested_table, body_stray_close]
+
+# ============================================================
+# DỰNG + GHI
+# ============================================================
+
+def article_page(rng, i, code, title, published, date_html, body_open, body_close, variant):
+    sents = [SENTENCES[(i + k) % len(SENTENCES)].format(c=code) for k in range(4)]
+    extra = ''
+    if i == 2:
+        extra = f'<meta property="article:published_time" content="{published.isoformat()}">'
+    if i == 3:
+        extra = ('<script type="application/ld+json">{"@context":"https://schema.org","@graph":'
+                 f'[{{"@type":"NewsArticle","datePublished":"{published.isoformat()}"}}]}}</script>')
+    if i == 5:
+        date_html = ''  # không có ngày trên trang -> dùng mốc ghi
+    article = (f'<main class="main"><div class="breadcrumb"><a href="/">Trang chủ</a> / <a href="/chung-khoan">Chứng khoán</a></div>'
+               f'<h1 class="title">{title}</h1><h2 class="sapo">{rng.choice(FILLER)}.</h2>{date_html}'
+               f'{variant(sents, body_open, body_close)}'
+               f'<div class="tags"><a href="/tag/{code.lower()}">{code}</a></div>{related(rng)}</main>')
+    html = f'<html lang="vi">{head(rng, title, extra)}<body>{header(rng)}<div class="container">{article}{sidebar(rng)}</div>{footer(rng)}'
+    # Bảng / thẻ lồng sai thì trang cũng thiếu </body></html>
+    return html if variant is body_nested_table else html + '</body></html>'
+
+
+def listing_page(rng, items):
+    side = '<div class="most-read"><a href="/tin-cu.html">Tin cũ được đọc nhiều nhất trong tháng trước</a></div>'
+    return (f'<html lang="vi">{head(rng, "Chứng khoán")}<body>{header(rng)}<div class="container">'
+            f'{side}<ul class="list">{"".join(items)}</ul>{sidebar(rng)}</div>{footer(rng)}</body></html>')
+
+
+def build_pages(now, rng):
+    pages = {}
+    n = 0
+    for name, (listing, path, date_fn, body_open, body_close) in SOURCES.items():
+        host = listing.split('/')[2]
+        items = []
+        for i in range(6):
+            code = CODES[(n + i) % len(CODES)]
+            published = now - timedelta(hours=1 + i * 2, minutes=7 * i)
+            title = f'{code}: Tin doanh nghiệp số {i} của chuyên mục {name} về kết quả kinh doanh quý'
+            pages[f'https://{host}{path(i)}'] = article_page(
+                rng, i, code, title, published, date_fn(published), body_open, body_close, VARIANTS[(n + i) % len(VARIANTS)]
+            )
+            label = [f'{published:%d/%m/%Y %H:%M}', 'Hôm qua', f'{published:%d/%m/%Y}', '',
+                     f'{published:%H:%M %d/%m/%Y}', '3 giờ trước'][i]
+            items.append(
+                f'<li class=item><a class="thumb" href="{path(i)}"><img src="/thumb/{i}.jpg" alt=""></a>'
+                f'<h3><a href="{path(i)}">{title}</a></h3><p class="sapo">{rng.choice(FILLER)}.</p>'
+                + (f'<span class="time">{label}</span>' if label else '') + '</li>'
+            )
+        n += 6
+        pages[listing] = listing_page(rng, items)
+    return pages
+
+
+class PagesAdapter(BaseAdapter):
+    """Trả trang dựng sẵn thay cho mạng (404 nếu không có)"""
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        body = self.pages.get(request.url)
+        response.status_code = 404 if body is None else 200
+        response._content = b'' if body is None else body.encode('utf-8')
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response.raw = io.BytesIO(response._content)
+        return response
+
+    def close(self):
+        pass
+
+
+def main():
+    # Streamlit chạy bare mode khi import app - bỏ các cảnh báo không liên quan
+    logging.disable(logging.WARNING)
+    module = load_app(os.path.join(os.path.dirname(HERE), 'app_full_patched.py'))
+    pages = build_pages(datetime.now(module.ArticleStore.VIETNAM_TZ), random.Random(2026))
+    session = requests.Session()
+    session.mount('https://', PagesAdapter(pages))
+    if os.path.exists(OUTPUT):
+        os.remove(OUTPUT)
+    archive = module.ResponseArchive(OUTPUT, mode='record')
+    scraper = module.StockScraperWeb(
+        module.load_default_stock_list(), session=session, archive=archive,
+        rate_limiter=module.DomainRateLimiter(requests_per_second=0),
+    )
+    df = scraper.run(max_articles_per_source=20)
+    sizes = sorted(len(body.encode('utf-8')) for body in pages.values())
+    print(f"{len(archive.urls())} trang đã ghi ({sizes[0] // 1024}-{sizes[-1] // 1024} KB) | "
+          f"run(): {0 if df is None else len(df)} dòng | lỗi: {scraper.errors}")
+
+
+if __name__ == '__main__':
+    main()